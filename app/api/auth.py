@@ -1,21 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException
 
 from ..core.response import to_response
-from ..dependencies.auth import get_auth_svc, get_current_user
-from ..models.user import User
+from ..dependencies.auth import check_login_rate, get_auth_svc, get_current_user
 from ..schemas.user import (
     LoginParams,
     RegisterParams,
     RegisterResult,
     RoleInfo,
     UserInfo,
+    UserPrincipal,
 )
 from ..services.auth import AuthService
 
 router = APIRouter(tags=["auth"])
 
 
-@router.post("/login")
+@router.post("/login", dependencies=[Depends(check_login_rate)])
 @to_response
 async def login(
     params: LoginParams,
@@ -29,7 +29,7 @@ async def login(
 
 @router.get("/getUserInfo")
 @to_response
-async def get_user_info(user: User = Depends(get_current_user)):
+async def get_user_info(user: UserPrincipal = Depends(get_current_user)):
     return UserInfo(
         roles=[RoleInfo(roleName=user.role_name, value=user.role_value)],
         userId=str(user.id),
@@ -42,11 +42,8 @@ async def get_user_info(user: User = Depends(get_current_user)):
 
 @router.get("/getPermCode")
 @to_response
-async def get_perm_code(
-    user: User = Depends(get_current_user),
-    auth_svc: AuthService = Depends(get_auth_svc),
-):
-    return auth_svc.get_perm_codes(user.role_value)
+async def get_perm_code(user: UserPrincipal = Depends(get_current_user)):
+    return user.perm_codes
 
 
 @router.get("/logout")
@@ -55,7 +52,11 @@ async def logout():
     return "退出登录成功"
 
 
-@router.post("/register", response_model=RegisterResult)
+@router.post(
+    "/register",
+    response_model=RegisterResult,
+    dependencies=[Depends(check_login_rate)],
+)
 async def register(
     params: RegisterParams,
     auth_svc: AuthService = Depends(get_auth_svc),
@@ -1,26 +1,51 @@
+from pathlib import Path
+from urllib.parse import quote
+
 from arq import ArqRedis
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, Form, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from kgtools.schemas.graph import GraphConfig
 from kgtools.schemas.preprocessing import ExtractConfig, NormalizeConfig
 
-from ..core.response import to_response
-from ..dependencies.document import get_doc, get_doc_svc
+from ..core import compression
+from ..core.jobs import BULK_QUEUE, GRAPH_QUEUE, enqueue_jobs
+from ..core.response import conditional_file_response, to_response
+from ..dependencies.auth import get_bulk_rate_key
+from ..dependencies.document import get_doc, get_doc_svc, get_docs
 from ..dependencies.redis import get_redis
 from ..schemas.base import Page
-from ..schemas.document import DocCreate, DocState, FileUploadResult
+from ..schemas.document import (
+    DocCreate,
+    DocFilter,
+    DocState,
+    DocUploadItem,
+    DocUploadResult,
+    FileType,
+    FileUploadResult,
+)
 from ..services import DocService
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
+FILE_MEDIA_TYPES = {
+    FileType.PDF: "application/pdf",
+    FileType.TXT: "text/plain; charset=utf-8",
+}
+
 
 @router.post("")
 async def create_doc(
     doc: DocCreate = Depends(get_doc),
     doc_svc: DocService = Depends(get_doc_svc),
+    redis: ArqRedis = Depends(get_redis),
 ):
-    """上传文档"""
+    """上传文档，内容与已有文档相同时直接复用其处理结果"""
     try:
         document = await doc_svc.create_doc(doc)
+        if document.state == DocState.NORMALIZED:
+            await redis.enqueue_job(
+                "update_doc_graph", document.id, GraphConfig(), _queue_name=GRAPH_QUEUE
+            )
         return FileUploadResult(
             code=200,
             message="上传成功",
@@ -31,6 +56,142 @@ async def create_doc(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post("/batch")
+async def create_docs(
+    docs: list[tuple[str, DocCreate | HTTPException]] = Depends(get_docs),
+    process: bool = Form(False, description="是否立即提取并标准化"),
+    doc_svc: DocService = Depends(get_doc_svc),
+    redis: ArqRedis = Depends(get_redis),
+    rate_key: str = Depends(get_bulk_rate_key),
+) -> list[DocUploadResult]:
+    """批量上传文档
+
+    所有文件并发写入磁盘，文档记录在一条语句中批量插入。process 为 True
+    时，在一个 Redis 管道中为新文档提交提取和标准化任务，任务进入批量
+    队列并按提交者限速。
+    """
+    doc_creates = [doc for _, doc in docs if isinstance(doc, DocCreate)]
+    try:
+        rows = iter(await doc_svc.create_docs(doc_creates))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    results = []
+    for file_name, upload in docs:
+        if isinstance(upload, HTTPException):
+            result = DocUploadResult(
+                success=False, fileName=file_name, document=None, error=upload.detail
+            )
+        else:
+            result = DocUploadResult(
+                success=True,
+                fileName=file_name,
+                document=DocUploadItem.model_validate(next(rows)),
+                error=None,
+            )
+        results.append(result)
+
+    documents = [result.document for result in results if result.document]
+    graph_jobs = [
+        ("update_doc_graph", (item.id, GraphConfig()))
+        for item in documents
+        if item.state == DocState.NORMALIZED
+    ]
+    await enqueue_jobs(redis, graph_jobs, GRAPH_QUEUE)
+    if process:
+        pending = [item for item in documents if item.state == DocState.UPLOADED]
+        pending_ids = [item.id for item in pending]
+        await doc_svc.update_docs_state(pending_ids, DocState.EXTRACTING)
+        for item in pending:
+            item.state = DocState.EXTRACTING
+        jobs = [
+            (
+                "process_doc",
+                (doc_id, ExtractConfig(), NormalizeConfig(), DocState.UPLOADED),
+            )
+            for doc_id in pending_ids
+        ]
+        await enqueue_jobs(redis, jobs, BULK_QUEUE, rate_key)
+
+    return results
+
+
+@router.post("/extract")
+@to_response
+async def extract_docs(
+    doc_filter: DocFilter,
+    doc_svc: DocService = Depends(get_doc_svc),
+    redis: ArqRedis = Depends(get_redis),
+    rate_key: str = Depends(get_bulk_rate_key),
+):
+    """批量提取文档 - 异步处理
+
+    符合筛选条件且未在处理中的文档在一条语句中切换为提取中，
+    所有任务在一个 Redis 管道中提交到批量队列并按提交者限速，
+    返回提交的文档ID。
+    """
+    docs = await _transition_docs(
+        doc_svc,
+        doc_filter,
+        {DocState.UPLOADED, DocState.EXTRACTED, DocState.NORMALIZED},
+        DocState.EXTRACTING,
+    )
+    await enqueue_jobs(
+        redis,
+        (
+            ("extract_doc", (doc_id, ExtractConfig(), current_state))
+            for doc_id, current_state in docs
+        ),
+        BULK_QUEUE,
+        rate_key,
+    )
+    return [doc_id for doc_id, _ in docs]
+
+
+@router.post("/normalize")
+@to_response
+async def normalize_docs(
+    doc_filter: DocFilter,
+    doc_svc: DocService = Depends(get_doc_svc),
+    redis: ArqRedis = Depends(get_redis),
+    rate_key: str = Depends(get_bulk_rate_key),
+):
+    """批量标准化文档 - 异步处理
+
+    符合筛选条件且已提取的文档在一条语句中切换为标准化中，
+    所有任务在一个 Redis 管道中提交到批量队列并按提交者限速，
+    返回提交的文档ID。
+    """
+    docs = await _transition_docs(
+        doc_svc,
+        doc_filter,
+        {DocState.EXTRACTED, DocState.NORMALIZED},
+        DocState.NORMALIZING,
+    )
+    await enqueue_jobs(
+        redis,
+        (
+            ("normalize_doc", (doc_id, NormalizeConfig(), current_state))
+            for doc_id, current_state in docs
+        ),
+        BULK_QUEUE,
+        rate_key,
+    )
+    return [doc_id for doc_id, _ in docs]
+
+
+async def _transition_docs(
+    doc_svc: DocService,
+    doc_filter: DocFilter,
+    from_states: set[DocState],
+    state: DocState,
+):
+    """校验筛选条件并批量切换文档状态"""
+    if doc_filter.ids is None and not doc_filter.subject and doc_filter.state is None:
+        raise ValueError("At least one of ids, subject or state is required")
+    return await doc_svc.transition_docs(doc_filter, from_states, state)
+
+
 @router.put("/{doc_id}/extract")
 @to_response
 async def extract_doc(
@@ -55,21 +216,117 @@ async def normalize_doc(
     await redis.enqueue_job("normalize_doc", doc_id, NormalizeConfig(), current_state)
 
 
+@router.put("/{doc_id}/process")
+@to_response
+async def process_doc(
+    doc_id: int,
+    doc_svc: DocService = Depends(get_doc_svc),
+    redis: ArqRedis = Depends(get_redis),
+):
+    """提取并标准化文档 - 异步处理"""
+    current_state = await doc_svc.update_doc_state(doc_id, DocState.EXTRACTING)
+    await redis.enqueue_job(
+        "process_doc", doc_id, ExtractConfig(), NormalizeConfig(), current_state
+    )
+
+
 @router.get("/{doc_id}/download")
 async def download_doc(
     doc_id: int,
     state: DocState = Query(DocState.UPLOADED, description="下载文件状态"),
+    accept_encoding: str | None = Header(None),
+    if_none_match: str | None = Header(None),
+    if_modified_since: str | None = Header(None),
     doc_svc: DocService = Depends(get_doc_svc),
 ):
-    """下载文档文件"""
-    path, filename = await doc_svc.download_doc(doc_id, state)
-    return FileResponse(
+    """下载文档文件
+
+    支持 Range/If-Range 断点续传以及 ETag/Last-Modified 条件请求。
+    文本压缩存储时，客户端接受该压缩格式则直接返回压缩后的内容并设置
+    Content-Encoding，否则流式解压后返回。
+    """
+    try:
+        path, filename = await doc_svc.download_doc(doc_id, state)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    codec = compression.get_path_codec(path)
+    if codec == "none":
+        return await conditional_file_response(
+            path,
+            if_none_match,
+            if_modified_since,
+            etag=_get_upload_etag(path) if state == DocState.UPLOADED else None,
+            filename=filename,
+            media_type="application/octet-stream",
+        )
+
+    content_encoding = compression.CONTENT_ENCODINGS[codec]
+    headers = {
+        "Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}",
+        "Vary": "Accept-Encoding",
+    }
+    if _accepts_encoding(accept_encoding, content_encoding):
+        headers["Content-Encoding"] = content_encoding
+        return await conditional_file_response(
+            path,
+            if_none_match,
+            if_modified_since,
+            headers=headers,
+            media_type="application/octet-stream",
+        )
+    return StreamingResponse(
+        compression.iter_bytes(path),
+        headers=headers,
+        media_type="application/octet-stream",
+    )
+
+
+@router.get("/{doc_id}/file")
+async def get_doc_file(
+    doc_id: int,
+    if_none_match: str | None = Header(None),
+    if_modified_since: str | None = Header(None),
+    doc_svc: DocService = Depends(get_doc_svc),
+):
+    """在线查看上传的原始文件，支持 Range 请求和条件请求"""
+    try:
+        path, filename = await doc_svc.download_doc(doc_id, DocState.UPLOADED)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    return await conditional_file_response(
         path,
+        if_none_match,
+        if_modified_since,
+        etag=_get_upload_etag(path),
         filename=filename,
-        media_type="application/octet-stream",
+        content_disposition_type="inline",
+        media_type=FILE_MEDIA_TYPES[FileType(path.suffix.removeprefix("."))],
     )
 
 
+def _get_upload_etag(path: Path) -> str:
+    """上传文件以内容哈希命名且不会改变，直接用作强 ETag"""
+    return f'"{path.stem}"'
+
+
+def _accepts_encoding(accept_encoding: str | None, encoding: str) -> bool:
+    """判断 Accept-Encoding 请求头是否接受指定的编码"""
+    if not accept_encoding:
+        return False
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        if name.strip().lower() not in {encoding, "*"}:
+            continue
+        key, _, value = params.partition("=")
+        try:
+            return key.strip() != "q" or float(value) > 0
+        except ValueError:
+            return False
+    return False
+
+
 @router.get("")
 @to_response
 async def get_doc_list(
@@ -93,7 +350,12 @@ async def get_doc_list(
 async def delete_doc(
     doc_id: int,
     doc_svc: DocService = Depends(get_doc_svc),
+    redis: ArqRedis = Depends(get_redis),
 ):
     """删除文档"""
     if not await doc_svc.delete_doc(doc_id):
         raise HTTPException(status_code=404, detail="Document not found")
+    # 从图谱中扣除该文档的贡献
+    await redis.enqueue_job(
+        "update_doc_graph", doc_id, GraphConfig(), _queue_name=GRAPH_QUEUE
+    )
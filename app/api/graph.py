@@ -1,10 +1,19 @@
 from arq import ArqRedis
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, Query, Response
 from kgtools.schemas.graph import GraphConfig
 
-from ..core.response import to_response
+from ..core.graph_cache import (
+    cache_graph_payload,
+    get_graph_payload,
+    get_graph_tag,
+    request_graph_cache,
+)
+from ..core.jobs import GRAPH_QUEUE
+from ..core.response import etag_matches, to_response
 from ..dependencies.graph import get_graph_svc
 from ..dependencies.redis import get_redis
+from ..schemas.base import Result, ResultEnum
+from ..schemas.subject import Subject
 from ..services import GraphService
 
 router = APIRouter(prefix="/graph", tags=["graph"])
@@ -12,18 +21,58 @@ router = APIRouter(prefix="/graph", tags=["graph"])
 
 @router.post("/build")
 @to_response
-async def build_graph(redis: ArqRedis = Depends(get_redis)):
-    """构建知识图谱"""
-    await redis.enqueue_job("build_graph", GraphConfig())
+async def build_graph(
+    full: bool = Query(False, description="是否全量重建"),
+    redis: ArqRedis = Depends(get_redis),
+):
+    """构建知识图谱，默认只增量计算发生变化的文档"""
+    await redis.enqueue_job("build_graph", GraphConfig(), full, _queue_name=GRAPH_QUEUE)
 
 
 @router.get("")
-@to_response
 async def get_graph(
+    subject: list[Subject] | None = Query(None, description="学科列表"),
+    keyword_id: int | None = Query(None, description="邻域中心关键词ID"),
+    hops: int = Query(1, ge=1, le=3, description="邻域跳数"),
+    top: int | None = Query(None, ge=1, description="按权重保留前 N 条边"),
+    min_weight: float | None = Query(None, description="最小边权重"),
+    if_none_match: str | None = Header(None),
+    redis: ArqRedis = Depends(get_redis),
     graph_svc: GraphService = Depends(get_graph_svc),
 ):
-    """提取知识图谱"""
-    graph = await graph_svc.get_graph()
-    if not graph:
-        raise HTTPException(status_code=404, detail="Graph not found")
-    return graph
+    """提取知识图谱
+
+    不带筛选条件时直接返回构建图谱时预先序列化的响应体，并支持 ETag
+    条件请求，缓存缺失时才从数据库读取，回填序列化结果后由图谱任务更新
+    当前图谱标识；带筛选条件时查询子图。
+    """
+    if subject or keyword_id is not None or top is not None or min_weight is not None:
+        graph = await graph_svc.get_subgraph(
+            subject=subject,
+            keyword_id=keyword_id,
+            hops=hops,
+            top=top,
+            min_weight=min_weight,
+        )
+        if graph is None:
+            return Result(code=ResultEnum.ERROR, message="Graph not found")
+        return Result(code=ResultEnum.SUCCESS, result=graph)
+
+    tag = await get_graph_tag(redis)
+    if tag is not None and etag_matches(if_none_match, f'"{tag}"'):
+        return Response(status_code=304, headers={"ETag": f'"{tag}"'})
+
+    payload = await get_graph_payload(redis, tag) if tag is not None else None
+    if payload is None:
+        graph_payload = await graph_svc.get_graph_payload()
+        if graph_payload is None:
+            return Result(code=ResultEnum.ERROR, message="Graph not found")
+        tag, payload = graph_payload
+        await cache_graph_payload(redis, tag, payload)
+        await request_graph_cache(redis)
+
+    return Response(
+        content=payload,
+        media_type="application/json",
+        headers={"ETag": f'"{tag}"'},
+    )
@@ -1,7 +1,13 @@
+from typing import AsyncIterator
+
+from arq import ArqRedis
 from fastapi import APIRouter, Depends, HTTPException, Query
+from kgtools.schemas.graph import GraphConfig
 
+from ..core.jobs import GRAPH_QUEUE
 from ..core.response import to_response
 from ..dependencies.keyword import get_keywords, get_kw_svc
+from ..dependencies.redis import get_redis
 from ..schemas.base import Page
 from ..schemas.keyword import KeywordCreate
 from ..schemas.subject import Subject
@@ -15,19 +21,25 @@ router = APIRouter(prefix="/keywords", tags=["keywords"])
 async def create_keyword(
     keyword: KeywordCreate,
     kw_svc: KeywordService = Depends(get_kw_svc),
+    redis: ArqRedis = Depends(get_redis),
 ):
     """创建关键词"""
     await kw_svc.create_keyword(keyword)
+    await redis.enqueue_job("index_keywords", _queue_name=GRAPH_QUEUE)
 
 
 @router.post("/upload")
 @to_response
 async def create_keywords(
-    keywords: list[KeywordCreate] = Depends(get_keywords),
+    chunks: AsyncIterator[tuple[list[dict], int, int]] = Depends(get_keywords),
     kw_svc: KeywordService = Depends(get_kw_svc),
+    redis: ArqRedis = Depends(get_redis),
 ):
-    """批量上传关键词"""
-    await kw_svc.create_keywords(keywords)
+    """批量上传关键词，返回新增、跳过和无效的数量"""
+    result = await kw_svc.import_keywords(chunks)
+    if result.inserted:
+        await redis.enqueue_job("index_keywords", _queue_name=GRAPH_QUEUE)
+    return result
 
 
 @router.get("")
@@ -56,7 +68,9 @@ async def get_keyword_list(
 async def delete_keyword(
     keyword_id: int,
     kw_svc: KeywordService = Depends(get_kw_svc),
+    redis: ArqRedis = Depends(get_redis),
 ):
     """删除关键词"""
     if not await kw_svc.delete_keyword(keyword_id):
         raise HTTPException(status_code=404, detail="Keyword not found")
+    await redis.enqueue_job("build_graph", GraphConfig(), _queue_name=GRAPH_QUEUE)
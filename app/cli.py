@@ -8,6 +8,13 @@ import typer
 
 cli = typer.Typer()
 
+# 各任务队列对应的 Worker 配置
+WORKER_SETTINGS = {
+    "interactive": "app.core.arq.WorkerSettings",
+    "bulk": "app.core.arq.BulkWorkerSettings",
+    "graph": "app.core.arq.GraphWorkerSettings",
+}
+
 
 def init_database(root_dir: Path):
     """初始化数据库"""
@@ -15,28 +22,32 @@ def init_database(root_dir: Path):
     subprocess.run([sys.executable, "scripts/init_db.py"], cwd=root_dir, check=True)
 
 
-def start_worker(root_dir: Path) -> subprocess.Popen:
-    """启动 worker 进程"""
+def get_queue(queue: str) -> str:
+    """校验任务队列名"""
+    if queue not in WORKER_SETTINGS:
+        raise typer.BadParameter(f"queue must be one of {', '.join(WORKER_SETTINGS)}")
+    return queue
+
+
+def start_worker(root_dir: Path, queue: str = "interactive") -> subprocess.Popen:
+    """启动消费指定队列的 worker 进程"""
     return subprocess.Popen(
-        [sys.executable, "-m", "arq", "app.core.arq.WorkerSettings"], cwd=root_dir
+        [sys.executable, "-m", "arq", WORKER_SETTINGS[queue]], cwd=root_dir
     )
 
 
-def start_workers(root_dir: Path, num_workers: int = 4) -> list[subprocess.Popen]:
-    """启动多个 worker 进程"""
-    workers = []
-    for _ in range(num_workers):
-        worker = subprocess.Popen(
-            [sys.executable, "-m", "arq", "app.core.arq.WorkerSettings"], cwd=root_dir
-        )
-        workers.append(worker)
-    return workers
+def start_workers(root_dir: Path, queues: list[str]) -> list[subprocess.Popen]:
+    """为每个队列名启动一个 worker 进程"""
+    return [start_worker(root_dir, queue) for queue in queues]
 
 
 @cli.command()
 def dev(
     init: bool = typer.Option(False, "--init", help="初始化数据库"),
-    workers: int = typer.Option(4, "--workers", "-w", help="worker 进程数量"),
+    workers: int = typer.Option(2, "--workers", "-w", help="交互队列 worker 进程数量"),
+    bulk_workers: int = typer.Option(
+        1, "--bulk-workers", help="批量队列 worker 进程数量"
+    ),
 ):
     """启动开发服务器和 workers"""
     root_dir = Path(__file__).parent.parent
@@ -48,14 +59,16 @@ def dev(
         [sys.executable, "-m", "uvicorn", "app.main:app", "--reload"], cwd=root_dir
     )
 
-    worker_processes = start_workers(root_dir, workers)
+    # 图谱任务需要依次执行，图谱队列只启动一个 worker
+    queues = ["interactive"] * workers + ["bulk"] * bulk_workers + ["graph"]
+    worker_processes = start_workers(root_dir, queues)
 
     def handle_sigterm():
         print("\nShutting down gracefully...")
         api_process.terminate()
         for i, worker in enumerate(worker_processes):
             worker.terminate()
-            print(f"Worker {i} terminated")
+            print(f"Worker {i} ({queues[i]}) terminated")
         api_process.wait()
         for worker in worker_processes:
             worker.wait()
@@ -67,8 +80,8 @@ def dev(
         # 检查 worker 进程
         for i, worker in enumerate(worker_processes):
             if worker.poll() is not None:
-                print(f"Worker {i} terminated, restarting...")
-                worker_processes[i] = start_worker(root_dir)
+                print(f"Worker {i} ({queues[i]}) terminated, restarting...")
+                worker_processes[i] = start_worker(root_dir, queues[i])
         time.sleep(1)
 
 
@@ -79,9 +92,17 @@ def api():
 
 
 @cli.command()
-def worker():
+def worker(
+    queue: str = typer.Option(
+        "interactive",
+        "--queue",
+        "-q",
+        callback=get_queue,
+        help="消费的任务队列 (interactive, bulk, graph)",
+    ),
+):
     """只启动 worker"""
-    subprocess.run([sys.executable, "-m", "arq", "app.core.arq.WorkerSettings"])
+    subprocess.run([sys.executable, "-m", "arq", WORKER_SETTINGS[queue]])
 
 
 def main():
@@ -1,16 +1,51 @@
+import asyncio
+import functools
 import logging
+from typing import Sequence
 
 from arq.connections import RedisSettings
+from arq.utils import timestamp_ms
 from kgtools.schemas.graph import GraphConfig
 from kgtools.schemas.preprocessing import ExtractConfig, NormalizeConfig
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..database import AsyncSessionLocal
+from ..models import Document
 from ..schemas.document import DocState
-from ..services import DocService, GraphService, KeywordService
+from ..services import DocKeywordService, DocService, GraphService, KeywordService
 from ..settings import settings
+from .executor import get_process_pool, shutdown_process_pool
+from .graph_cache import (
+    GRAPH_CACHE_PENDING_KEY,
+    get_graph_payload,
+    get_graph_tag,
+    request_graph_cache,
+    set_graph_payload,
+    set_graph_tag,
+)
+from .jobs import BULK_QUEUE, GRAPH_LOCK_KEY, GRAPH_QUEUE, INTERACTIVE_QUEUE
+from .matcher import KeywordMatcher
 
 logger = logging.getLogger(__name__)
 
+# 单个任务的超时时间 (秒)，也是图谱锁的过期时间
+JOB_TIMEOUT = settings.EXTRACT_TIMEOUT + settings.NORMALIZE_TIMEOUT
+
+
+def graph_job(func):
+    """图谱任务装饰器
+
+    图谱任务持有同一把 Redis 锁依次执行，即使启动了多个图谱 worker，
+    全量重建、增量更新和版本回收也不会交错。锁在任务超时后自动过期。
+    """
+
+    @functools.wraps(func)
+    async def wrapper(ctx, *args, **kwargs):
+        async with ctx["redis"].lock(GRAPH_LOCK_KEY, timeout=JOB_TIMEOUT):
+            return await func(ctx, *args, **kwargs)
+
+    return wrapper
+
 
 async def extract_doc(
     ctx,
@@ -24,9 +59,18 @@ async def extract_doc(
         try:
             if current_state in {DocState.EXTRACTING, DocState.NORMALIZING}:
                 raise ValueError("doc is already processing")
-            await doc_svc.extract_doc(doc_id, config)
+            if await doc_svc.extract_doc(doc_id, config) is None:
+                # 提取结果已存在 (可能由内容相同的文档生成)，至少处于已提取状态
+                logger.info(f"extract doc {doc_id} skipped: inputs unchanged")
+                if current_state < DocState.EXTRACTED:
+                    current_state = DocState.EXTRACTED
+                await doc_svc.update_doc_state(doc_id, current_state)
+        except asyncio.CancelledError:
+            logger.warning(f"extract doc {doc_id} cancelled")
+            await doc_svc.update_doc_state(doc_id, current_state)
+            raise
         except Exception as e:
-            logger.error(f"extract doc {doc_id} failed: {e}")
+            logger.error(f"extract doc {doc_id} failed: {e!r}")
             await doc_svc.update_doc_state(doc_id, current_state)
 
 
@@ -42,49 +86,324 @@ async def normalize_doc(
         try:
             if current_state not in {DocState.EXTRACTED, DocState.NORMALIZED}:
                 raise ValueError("doc is not in extracted state")
-            await doc_svc.normalize_doc(doc_id, config)
+            text = await doc_svc.normalize_doc(doc_id, config)
+            if text is None:
+                logger.info(f"normalize doc {doc_id} skipped: inputs unchanged")
+                await doc_svc.update_doc_state(doc_id, DocState.NORMALIZED)
+                # 首次进入标准化状态的文档需要计入图谱
+                doc_ids = [] if current_state == DocState.NORMALIZED else [doc_id]
+            else:
+                doc_ids = await _index_normalized_doc(session, doc_id, text)
+        except asyncio.CancelledError:
+            logger.warning(f"normalize doc {doc_id} cancelled")
+            await doc_svc.update_doc_state(doc_id, current_state)
+            raise
+        except Exception as e:
+            logger.error(f"normalize doc {doc_id} failed: {e!r}")
+            await doc_svc.update_doc_state(doc_id, current_state)
+            return
+
+    # 标准化文本变化后增量更新这些文档对图谱的贡献
+    for shared_id in doc_ids:
+        await ctx["redis"].enqueue_job(
+            "update_doc_graph", shared_id, GraphConfig(), _queue_name=GRAPH_QUEUE
+        )
+
+
+async def process_doc(
+    ctx,
+    doc_id: int,
+    extract_config: ExtractConfig,
+    normalize_config: NormalizeConfig,
+    current_state: DocState,
+):
+    """文档提取并标准化任务
+
+    两个阶段在同一个会话中依次执行，提取的文本直接在内存中交给标准化，
+    每个阶段完成时各更新一次状态，失败时恢复到最后完成的阶段。
+    输入指纹未变化的阶段直接跳过。
+    """
+    async with AsyncSessionLocal() as session:
+        doc_svc = DocService(session)
+        try:
+            if current_state in {DocState.EXTRACTING, DocState.NORMALIZING}:
+                raise ValueError("doc is already processing")
+            was_normalized = current_state == DocState.NORMALIZED
+            raw_text = await doc_svc.extract_doc(
+                doc_id, extract_config, next_state=DocState.NORMALIZING
+            )
+            if raw_text is None:
+                await doc_svc.update_doc_state(doc_id, DocState.NORMALIZING)
+            current_state = DocState.EXTRACTED
+
+            # 提取被跳过时 raw_text 为空，只有需要标准化时才从磁盘读取
+            text = await doc_svc.normalize_doc(doc_id, normalize_config, raw_text)
+            if text is None:
+                logger.info(f"process doc {doc_id} skipped: inputs unchanged")
+                await doc_svc.update_doc_state(doc_id, DocState.NORMALIZED)
+                doc_ids = [] if was_normalized else [doc_id]
+            else:
+                doc_ids = await _index_normalized_doc(session, doc_id, text)
+        except asyncio.CancelledError:
+            logger.warning(f"process doc {doc_id} cancelled")
+            await doc_svc.update_doc_state(doc_id, current_state)
+            raise
         except Exception as e:
-            logger.error(f"normalize doc {doc_id} failed: {e}")
+            logger.error(f"process doc {doc_id} failed: {e!r}")
             await doc_svc.update_doc_state(doc_id, current_state)
+            return
 
+    for shared_id in doc_ids:
+        await ctx["redis"].enqueue_job(
+            "update_doc_graph", shared_id, GraphConfig(), _queue_name=GRAPH_QUEUE
+        )
 
-async def build_graph(ctx, config: GraphConfig):
-    """构建知识图谱任务"""
+
+async def _index_normalized_doc(
+    session: AsyncSession, doc_id: int, text: str
+) -> list[int]:
+    """统计刚标准化的文档中的关键词出现次数
+
+    内容相同的文档共享标准化文本，出现次数也相同，一并更新。
+
+    Returns:
+        需要更新图谱贡献的文档 ID
+    """
+    matcher = await KeywordService(session).get_matcher()
+    counts = await asyncio.to_thread(matcher.count_ids, text)
+    doc_ids = [doc_id, *await DocService(session).get_shared_doc_ids(doc_id)]
+    doc_kw_svc = DocKeywordService(session)
+    for shared_id in doc_ids:
+        await doc_kw_svc.set_keyword_counts(shared_id, counts)
+    return doc_ids
+
+
+async def _iter_doc_texts(docs: Sequence[Document]):
+    """逐个读取文档的标准化文本，避免同时持有整个语料"""
+    for doc in docs:
+        yield doc.id, await doc.read_text(DocState.NORMALIZED)
+
+
+async def _sync_doc_graph(
+    session: AsyncSession, doc_id: int, matcher: KeywordMatcher, config: GraphConfig
+):
+    """根据已存储的关键词出现次数更新单个文档对图谱的贡献"""
+    graph_svc = GraphService(session)
+    doc = await DocService(session).get_doc(doc_id)
+    if doc is None or doc.state != DocState.NORMALIZED:
+        await graph_svc.update_doc_graph(doc_id, None, matcher, config)
+        return
+
+    counts = await DocKeywordService(session).get_keyword_counts(doc_id)
+    hits = [matcher.index[kw_id] for kw_id in counts if kw_id in matcher.index]
+    # 出现的关键词少于两个时不会产生关系，无需读取文本
+    text = await doc.read_text(DocState.NORMALIZED) if len(hits) >= 2 else ""
+    await graph_svc.update_doc_graph(doc_id, text, matcher, config, hits)
+
+
+@graph_job
+async def build_graph(ctx, config: GraphConfig, full: bool = False):
+    """构建知识图谱任务
+
+    默认增量构建：只计算尚未计入图谱的标准化文档，并扣除已删除或
+    不再处于标准化状态的文档的贡献。full 为 True 时全量重建。
+    """
     try:
         async with AsyncSessionLocal() as session:
-            doc_svc = DocService(session)
-            docs = await doc_svc.get_docs()
+            kw_svc = KeywordService(session)
+            matcher = await kw_svc.get_matcher()
+            if not matcher:
+                logger.warning("No keywords found in documents")
+                return
 
-            doc_texts = []
-            for doc in docs:
+            doc_svc = DocService(session)
+            normalized_docs = []
+            for doc in await doc_svc.get_docs():
                 if doc.state != DocState.NORMALIZED:
                     logger.warning(f"doc {doc.id} is not normalized")
                     continue
-                doc_text = await doc.read_text(DocState.NORMALIZED)
-                doc_texts.append(doc_text)
-            if not doc_texts:
-                logger.warning("No normalized docs found")
+                normalized_docs.append(doc)
+
+            graph_svc = GraphService(session)
+            if full:
+                if not normalized_docs:
+                    logger.warning("No normalized docs found")
+                    return
+
+                doc_texts = _iter_doc_texts(normalized_docs)
+                await graph_svc.build_graph(doc_texts, matcher, config)
+                await request_graph_cache(ctx["redis"])
+                await ctx["redis"].enqueue_job(
+                    "gc_graph_versions", _queue_name=GRAPH_QUEUE
+                )
                 return
 
+            # 每次提交后 ORM 对象会过期，先记录 ID，再逐个重新读取文档
+            pending_ids = [doc.id for doc in normalized_docs if not doc.graph_synced]
+            normalized_ids = {doc.id for doc in normalized_docs}
+            stale_ids = await graph_svc.get_graph_doc_ids() - normalized_ids
+
+            for doc_id in stale_ids:
+                await graph_svc.update_doc_graph(doc_id, None, matcher, config)
+
+            for doc_id in pending_ids:
+                await _sync_doc_graph(session, doc_id, matcher, config)
+
+        await request_graph_cache(ctx["redis"])
+
+    except Exception as e:
+        logger.error(f"build graph failed: {e}")
+
+
+@graph_job
+async def update_doc_graph(ctx, doc_id: int, config: GraphConfig):
+    """增量更新单个文档对知识图谱的贡献
+
+    文档不存在或未处于标准化状态时，扣除其原有贡献。
+    """
+    try:
+        async with AsyncSessionLocal() as session:
             kw_svc = KeywordService(session)
-            keywords = await kw_svc.get_keywords()
-            if not keywords:
+            matcher = await kw_svc.get_matcher()
+            if not matcher:
                 logger.warning("No keywords found in documents")
                 return
 
+            await _sync_doc_graph(session, doc_id, matcher, config)
+
+        await request_graph_cache(ctx["redis"])
+
+    except Exception as e:
+        logger.error(f"update graph for doc {doc_id} failed: {e}")
+
+
+@graph_job
+async def index_keywords(ctx):
+    """统计新增关键词在各文档中的出现次数，并增量更新受影响的图谱"""
+    try:
+        async with AsyncSessionLocal() as session:
+            kw_svc = KeywordService(session)
+            keywords = await kw_svc.get_unindexed_keywords()
+            if not keywords:
+                return
+
+            doc_svc = DocService(session)
+            docs = [
+                doc
+                for doc in await doc_svc.get_docs()
+                if doc.state == DocState.NORMALIZED
+            ]
+            doc_kw_svc = DocKeywordService(session)
+            count = await doc_kw_svc.index_keywords(keywords, _iter_doc_texts(docs))
+            logger.info(f"indexed {len(keywords)} keywords in {count} docs")
+
+        await ctx["redis"].enqueue_job(
+            "build_graph", GraphConfig(), _queue_name=GRAPH_QUEUE
+        )
+    except Exception as e:
+        logger.error(f"index keywords failed: {e}")
+
+
+@graph_job
+async def cache_graph(ctx):
+    """预先序列化当前图谱并写入 Redis，图谱未变化时跳过
+
+    当前图谱标识只由该任务写入。请求已回填当前版本的序列化结果时直接复用。
+    图谱队列中还有待执行的任务时推迟序列化，它们完成后只序列化一次。
+    """
+    redis = ctx["redis"]
+    try:
+        # 队列中包括当前任务本身
+        if await redis.zcount(GRAPH_QUEUE, "-inf", timestamp_ms()) > 1:
+            await redis.enqueue_job(
+                "cache_graph",
+                _queue_name=GRAPH_QUEUE,
+                _defer_by=settings.GRAPH_CACHE_DELAY,
+            )
+            return
+        # 开始读取图谱前清除标记，之后的更新会重新提交缓存任务
+        await redis.delete(GRAPH_CACHE_PENDING_KEY)
+
+        async with AsyncSessionLocal() as session:
             graph_svc = GraphService(session)
-            await graph_svc.build_graph(doc_texts, keywords, config)
+            active_version = await graph_svc.get_active_version()
+            if active_version is None:
+                return
+            tag = active_version.tag
+            if tag == await get_graph_tag(redis):
+                return
+            if await get_graph_payload(redis, tag) is not None:
+                await set_graph_tag(redis, tag)
+                return
 
+            graph_payload = await graph_svc.get_graph_payload()
+            if graph_payload is None:
+                return
+            await set_graph_payload(redis, *graph_payload)
     except Exception as e:
-        logger.error(f"build graph failed: {e}")
+        logger.error(f"cache graph failed: {e}")
+
+
+@graph_job
+async def gc_graph_versions(ctx):
+    """回收旧版本图谱任务"""
+    try:
+        async with AsyncSessionLocal() as session:
+            graph_svc = GraphService(session)
+            count = await graph_svc.gc_versions()
+            logger.info(f"collected {count} graph versions")
+    except Exception as e:
+        logger.error(f"gc graph versions failed: {e}")
+
+
+async def startup(ctx):
+    """预先启动进程池"""
+    get_process_pool()
+
+
+async def shutdown(ctx):
+    """关闭进程池"""
+    shutdown_process_pool()
 
 
 class WorkerSettings:
-    """Arq Worker 配置"""
+    """Arq Worker 配置，消费交互队列"""
 
     redis_settings = RedisSettings(
         host=settings.REDIS_HOST,
         port=settings.REDIS_PORT,
         database=settings.REDIS_DB,
     )
-    functions = [extract_doc, normalize_doc, build_graph]
+    functions = [
+        extract_doc,
+        normalize_doc,
+        process_doc,
+        build_graph,
+        update_doc_graph,
+        index_keywords,
+        cache_graph,
+        gc_graph_versions,
+    ]
+    on_startup = startup
+    on_shutdown = shutdown
+    # 提取任务在进程池中运行，事件循环可同时持有多个任务
+    max_jobs = 2 * settings.PROCESS_POOL_WORKERS
+    job_timeout = JOB_TIMEOUT
+    queue_name = INTERACTIVE_QUEUE
+
+
+class BulkWorkerSettings(WorkerSettings):
+    """消费批量队列的 Worker 配置"""
+
+    queue_name = BULK_QUEUE
+
+
+class GraphWorkerSettings(WorkerSettings):
+    """消费图谱队列的 Worker 配置
+
+    图谱任务逐个执行，避免全量重建与增量更新交错时丢失增量；多个图谱
+    worker 之间由 graph_job 的锁互斥。
+    """
+
+    queue_name = GRAPH_QUEUE
+    max_jobs = 1
@@ -0,0 +1,69 @@
+from itertools import islice
+from typing import Iterable, Iterator, Sequence, TypeVar
+
+from sqlalchemy import FromClause, Table, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# 非 PostgreSQL 数据库每次 executemany 的记录数，限制内存占用
+BULK_CHUNK_SIZE = 10000
+
+T = TypeVar("T")
+
+
+def iter_chunks(values: Iterable[T], size: int) -> Iterator[list[T]]:
+    """按块切分，用于拆分 IN 条件，避免超出数据库的参数数量上限"""
+    values = iter(values)
+    while chunk := list(islice(values, size)):
+        yield chunk
+
+
+async def bulk_insert(
+    db: AsyncSession,
+    table: FromClause,
+    columns: Sequence[str],
+    records: Iterable[tuple],
+) -> int:
+    """绕过 ORM 批量插入记录，返回插入的行数
+
+    PostgreSQL 下使用 asyncpg 的 COPY，其余数据库按块执行 executemany。
+    记录按需从迭代器中读取，不会整体物化。
+    """
+    # 声明式模型的 __table__ 在类型上只是 FromClause
+    assert isinstance(table, Table)
+    conn = await db.connection()
+    if conn.dialect.name == "postgresql":
+        raw_conn = await conn.get_raw_connection()
+        driver_conn = raw_conn.driver_connection
+        assert driver_conn is not None
+        status = await driver_conn.copy_records_to_table(
+            table.name,
+            records=records,
+            columns=list(columns),
+            schema_name=table.schema,
+        )
+        return int(status.split()[-1])
+
+    records = iter(records)
+    count = 0
+    while chunk := list(islice(records, BULK_CHUNK_SIZE)):
+        await db.execute(insert(table), [dict(zip(columns, row)) for row in chunk])
+        count += len(chunk)
+    return count
+
+
+async def conflict_insert(db: AsyncSession, table: FromClause):
+    """获取支持 ON CONFLICT 子句的 insert 构造
+
+    PostgreSQL 与 SQLite 的 insert 均提供 on_conflict_do_nothing 和
+    on_conflict_do_update，其余数据库不支持。
+    """
+    assert isinstance(table, Table)
+    conn = await db.connection()
+    match conn.dialect.name:
+        case "postgresql":
+            return postgresql.insert(table)
+        case "sqlite":
+            return sqlite.insert(table)
+        case name:
+            raise NotImplementedError(f"ON CONFLICT is not supported by {name}")
@@ -0,0 +1,91 @@
+import gzip
+import io
+from pathlib import Path
+from typing import IO, Iterator, Literal
+
+from ..settings import settings
+
+try:
+    import zstandard
+except ImportError:  # zstandard 为可选依赖
+    zstandard = None  # type: ignore[assignment]
+
+Codec = Literal["none", "zstd", "gzip"]
+
+# 各压缩格式对应的文件后缀及 HTTP Content-Encoding
+SUFFIXES: dict[Codec, str] = {"none": "", "zstd": ".zst", "gzip": ".gz"}
+CONTENT_ENCODINGS: dict[Codec, str] = {"zstd": "zstd", "gzip": "gzip"}
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def get_codec() -> Codec:
+    """获取写入文本时使用的压缩格式，未安装 zstandard 时退回 gzip"""
+    codec = settings.TEXT_COMPRESSION
+    if codec == "zstd" and zstandard is None:
+        return "gzip"
+    return codec
+
+
+def get_variants(path: Path) -> list[Path]:
+    """获取文本文件所有可能的存储路径，当前压缩格式优先"""
+    preferred = get_codec()
+    codecs = [preferred, *(codec for codec in SUFFIXES if codec != preferred)]
+    return [with_codec(path, codec) for codec in codecs]
+
+
+def with_codec(path: Path, codec: Codec) -> Path:
+    """获取以指定格式压缩存储时的文件路径"""
+    return path.with_name(path.name + SUFFIXES[codec])
+
+
+def get_path_codec(path: Path) -> Codec:
+    """根据文件后缀判断压缩格式"""
+    for codec, suffix in SUFFIXES.items():
+        if suffix and path.name.endswith(suffix):
+            return codec
+    return "none"
+
+
+def open_reader(path: Path) -> IO[bytes] | gzip.GzipFile:
+    """打开文件并返回流式解压的二进制读取器"""
+    codec = get_path_codec(path)
+    if codec == "gzip":
+        return gzip.open(path, "rb")
+    file = path.open("rb")
+    if codec == "zstd":
+        if zstandard is None:
+            file.close()
+            raise RuntimeError("zstandard is required to read zstd compressed text")
+        return zstandard.ZstdDecompressor().stream_reader(file, closefd=True)
+    return file
+
+
+def read_text(path: Path) -> str:
+    """流式解压并读取文本文件"""
+    with open_reader(path) as reader:
+        return io.TextIOWrapper(reader, encoding="utf-8").read()
+
+
+def iter_bytes(path: Path) -> Iterator[bytes]:
+    """逐块产出解压后的文件内容"""
+    with open_reader(path) as reader:
+        while chunk := reader.read(READ_CHUNK_SIZE):
+            yield chunk
+
+
+def write_text(path: Path, text: str, codec: Codec):
+    """以指定格式压缩写入文本文件"""
+    data = text.encode("utf-8")
+    if codec == "gzip":
+        with gzip.open(
+            path, "wb", compresslevel=settings.TEXT_COMPRESSION_LEVEL
+        ) as gzip_file:
+            gzip_file.write(data)
+    elif codec == "zstd":
+        assert zstandard is not None
+        compressor = zstandard.ZstdCompressor(level=settings.TEXT_COMPRESSION_LEVEL)
+        with path.open("wb") as file, compressor.stream_writer(file) as writer:
+            writer.write(data)
+    else:
+        path.write_bytes(data)
@@ -0,0 +1,86 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from ..settings import settings
+
+T = TypeVar("T")
+
+_pool: ProcessPoolExecutor | None = None
+_pool_semaphore: asyncio.Semaphore | None = None
+_hash_pool: ThreadPoolExecutor | None = None
+_hash_semaphore: asyncio.Semaphore | None = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """获取进程内共享的 CPU 密集型任务进程池"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.PROCESS_POOL_WORKERS)
+    return _pool
+
+
+def get_hash_pool() -> ThreadPoolExecutor:
+    """获取密码哈希专用的线程池"""
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ThreadPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            thread_name_prefix="password-hash",
+        )
+    return _hash_pool
+
+
+def shutdown_process_pool():
+    """关闭进程池，取消尚未开始的任务"""
+    global _pool, _pool_semaphore
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+        _pool_semaphore = None
+
+
+async def run_in_process(func: Callable[[], T], timeout: float | None = None) -> T:
+    """在进程池中执行 CPU 密集型函数，不阻塞事件循环
+
+    同时提交到进程池的调用数不超过进程数，其余调用在事件循环中等待空闲
+    进程，超时只计算调用在子进程中的运行时间。
+
+    超时或所在任务被取消时，调用方立即收到异常，但已在子进程中运行的
+    调用无法中断：它会继续运行到结束 (如提取完当前页)，期间仍占用该进程，
+    结束后才释放给其他调用。
+
+    Args:
+        func: 可序列化的无参可调用对象，通常为 functools.partial
+        timeout: 运行超时时间 (秒)，None 表示不限制
+    """
+    global _pool_semaphore
+    if _pool_semaphore is None:
+        _pool_semaphore = asyncio.Semaphore(settings.PROCESS_POOL_WORKERS)
+    semaphore = _pool_semaphore
+    loop = asyncio.get_running_loop()
+
+    await semaphore.acquire()
+    try:
+        future = get_process_pool().submit(func)
+    except BaseException:
+        semaphore.release()
+        raise
+    # 子进程中的调用结束 (或在开始前被取消) 后才释放槽位
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(semaphore.release))
+    return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+
+async def run_password_hash(func: Callable[[], T]) -> T:
+    """在有界线程池中执行密码哈希或校验，不阻塞事件循环
+
+    bcrypt 计算时释放 GIL，可在线程中并行。同时提交到线程池的调用数受
+    PASSWORD_HASH_CONCURRENCY 限制，其余调用在事件循环中等待，请求被
+    取消时不会在线程池中留下积压。
+    """
+    global _hash_semaphore
+    if _hash_semaphore is None:
+        _hash_semaphore = asyncio.Semaphore(settings.PASSWORD_HASH_CONCURRENCY)
+    async with _hash_semaphore:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_hash_pool(), func)
@@ -0,0 +1,59 @@
+from arq import ArqRedis
+from redis.asyncio import Redis
+
+from ..settings import settings
+from .jobs import GRAPH_QUEUE
+
+GRAPH_TAG_KEY = "kg:graph:tag"
+GRAPH_PAYLOAD_KEY = "kg:graph:payload:{tag}"
+# 旧版本的序列化结果保留一天，供仍持有旧标识的请求读取
+GRAPH_PAYLOAD_TTL = 24 * 60 * 60
+# 已有尚未开始的缓存任务的标记，过期后允许再次提交，避免任务丢失后无法恢复
+GRAPH_CACHE_PENDING_KEY = "kg:graph:cache_pending"
+GRAPH_CACHE_PENDING_TTL = 10 * 60
+
+
+async def request_graph_cache(redis: ArqRedis):
+    """提交延迟执行的图谱缓存任务
+
+    已有尚未开始的缓存任务时不再提交，连续的增量更新只触发一次序列化。
+    """
+    if await redis.set(GRAPH_CACHE_PENDING_KEY, 1, nx=True, ex=GRAPH_CACHE_PENDING_TTL):
+        await redis.enqueue_job(
+            "cache_graph",
+            _queue_name=GRAPH_QUEUE,
+            _defer_by=settings.GRAPH_CACHE_DELAY,
+        )
+
+
+async def get_graph_tag(redis: Redis) -> str | None:
+    """获取已缓存图谱的内容标识"""
+    tag = await redis.get(GRAPH_TAG_KEY)
+    return tag.decode() if tag is not None else None
+
+
+async def get_graph_payload(redis: Redis, tag: str) -> bytes | None:
+    """获取指定标识的图谱序列化结果"""
+    return await redis.get(GRAPH_PAYLOAD_KEY.format(tag=tag))
+
+
+async def cache_graph_payload(redis: Redis, tag: str, payload: bytes):
+    """只写入指定标识的图谱序列化结果，不修改当前图谱标识
+
+    供请求在缓存缺失时回填。当前图谱标识只由图谱任务写入，读到旧版本的
+    请求不会覆盖 worker 写入的新标识。
+    """
+    await redis.set(GRAPH_PAYLOAD_KEY.format(tag=tag), payload, ex=GRAPH_PAYLOAD_TTL)
+
+
+async def set_graph_tag(redis: Redis, tag: str):
+    """将已缓存的序列化结果设为当前图谱"""
+    await redis.set(GRAPH_TAG_KEY, tag)
+
+
+async def set_graph_payload(redis: Redis, tag: str, payload: bytes):
+    """写入图谱序列化结果并将其设为当前图谱"""
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.set(GRAPH_PAYLOAD_KEY.format(tag=tag), payload, ex=GRAPH_PAYLOAD_TTL)
+        pipe.set(GRAPH_TAG_KEY, tag)
+        await pipe.execute()
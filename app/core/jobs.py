@@ -0,0 +1,106 @@
+from typing import Any, Iterable
+from uuid import uuid4
+
+from arq import ArqRedis
+from arq.constants import default_queue_name, job_key_prefix
+from arq.jobs import serialize_job
+from arq.utils import timestamp_ms
+
+from ..settings import settings
+
+# 任务队列：交互队列沿用 arq 默认队列名，单个文档的操作提交到这里；
+# 批量导入和批量处理提交到批量队列；图谱相关任务提交到图谱队列。
+# 每个队列由各自的 worker 消费，批量积压不会阻塞交互任务。
+INTERACTIVE_QUEUE = default_queue_name
+BULK_QUEUE = f"{default_queue_name}:bulk"
+GRAPH_QUEUE = f"{default_queue_name}:graph"
+QUEUES = {
+    "interactive": INTERACTIVE_QUEUE,
+    "bulk": BULK_QUEUE,
+    "graph": GRAPH_QUEUE,
+}
+
+RATE_KEY_PREFIX = "arq:rate:"
+# 图谱任务互斥锁
+GRAPH_LOCK_KEY = "arq:lock:graph"
+
+# 原子地为一批任务预留执行时间槽，返回第一个时间槽 (毫秒时间戳)
+_RESERVE_SCRIPT = """
+local start = math.max(tonumber(ARGV[1]), tonumber(redis.call('GET', KEYS[1]) or 0))
+local next_slot = start + tonumber(ARGV[2]) * tonumber(ARGV[3])
+redis.call('SET', KEYS[1], next_slot, 'PX', next_slot - tonumber(ARGV[1]) + 1000)
+return start
+"""
+
+
+async def reserve_slots(
+    redis: ArqRedis, rate_key: str, count: int, now_ms: int
+) -> tuple[int, int]:
+    """按提交者的速率限制为一批任务预留执行时间
+
+    rate_key 标识提交者：已登录用户为 user:<id>，匿名提交为 batch:<id>。
+    同一提交者的任务按 BULK_JOBS_PER_SECOND 依次排开，后提交的批次排在
+    前一批之后；不同提交者互不影响，各自的任务在队列中交错执行。
+
+    Returns:
+        (第一个任务的执行时间, 相邻任务的间隔)，单位为毫秒
+    """
+    if settings.BULK_JOBS_PER_SECOND <= 0 or count == 0:
+        return now_ms, 0
+    interval_ms = max(1, round(1000 / settings.BULK_JOBS_PER_SECOND))
+    reserve = redis.register_script(_RESERVE_SCRIPT)
+    start_ms = await reserve(
+        keys=[RATE_KEY_PREFIX + rate_key], args=[now_ms, count, interval_ms]
+    )
+    return int(start_ms), interval_ms
+
+
+async def enqueue_jobs(
+    redis: ArqRedis,
+    jobs: Iterable[tuple[str, tuple[Any, ...]]],
+    queue_name: str | None = None,
+    rate_key: str | None = None,
+) -> list[str]:
+    """在一个 Redis 管道中批量提交任务
+
+    与逐个调用 enqueue_job 相比只需一次网络往返。任务 ID 随机生成，
+    不做去重检查。
+
+    Args:
+        redis: arq 连接池
+        jobs: (任务函数名, 位置参数) 列表
+        queue_name: 任务队列名，默认使用连接池的默认队列
+        rate_key: 速率限制的提交者标识，为空时不限速
+
+    Returns:
+        提交的任务 ID 列表
+    """
+    queue_name = queue_name or redis.default_queue_name
+    jobs = list(jobs)
+    enqueue_time_ms = timestamp_ms()
+    # arq 按分数取出到期的任务，分数即计划执行时间
+    start_ms, interval_ms = enqueue_time_ms, 0
+    if rate_key is not None:
+        start_ms, interval_ms = await reserve_slots(
+            redis, rate_key, len(jobs), enqueue_time_ms
+        )
+    job_ids = []
+    async with redis.pipeline(transaction=False) as pipe:
+        for index, (function, args) in enumerate(jobs):
+            job_id = uuid4().hex
+            score = start_ms + index * interval_ms
+            job = serialize_job(
+                function,
+                args,
+                {},
+                None,
+                enqueue_time_ms,
+                serializer=redis.job_serializer,
+            )
+            expires_ms = score - enqueue_time_ms + redis.expires_extra_ms
+            pipe.psetex(job_key_prefix + job_id, expires_ms, job)
+            pipe.zadd(queue_name, {job_id: score})
+            job_ids.append(job_id)
+        if job_ids:
+            await pipe.execute()
+    return job_ids
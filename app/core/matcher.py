@@ -0,0 +1,78 @@
+from collections import Counter, deque
+
+
+class KeywordMatcher:
+    """基于 Aho-Corasick 自动机的多模式关键词匹配器
+
+    构建一次后，对任意文本只需扫描一遍即可找出所有关键词的出现位置，
+    耗时与关键词数量无关。关键词以其在构建时的顺序编号。
+    """
+
+    def __init__(self, keywords: dict[int, str]):
+        """
+        Args:
+            keywords: 关键词 ID 到名称的映射
+        """
+        self.ids = list(keywords)
+        self.names = list(keywords.values())
+        self.index = {keyword_id: index for index, keyword_id in enumerate(self.ids)}
+
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[list[int]] = [[]]
+
+        for index, name in enumerate(self.names):
+            state = 0
+            for char in name:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[state][char] = next_state
+                state = next_state
+            if state:
+                self._output[state].append(index)
+
+        # 按层次遍历构建失败指针，并合并后缀状态的输出
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = (
+                    self._output[next_state] + self._output[self._fail[next_state]]
+                )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def count(self, text: str) -> Counter[int]:
+        """统计文本中每个关键词的出现次数
+
+        Returns:
+            关键词序号到出现次数的映射，未出现的关键词不包含在内
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        counts: Counter[int] = Counter()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                counts.update(output[state])
+        return counts
+
+    def count_ids(self, text: str) -> dict[int, int]:
+        """统计文本中每个关键词的出现次数，以关键词 ID 为键"""
+        return {self.ids[index]: count for index, count in self.count(text).items()}
+
+    def find_ids(self, text: str) -> set[int]:
+        """获取文本中出现的关键词 ID"""
+        return {self.ids[index] for index in self.count(text)}
@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict
+
+from redis.asyncio import Redis
+
+from ..schemas.user import UserPrincipal
+from ..settings import settings
+
+PRINCIPAL_KEY = "kg:auth:principal:{subject}"
+
+
+class PrincipalCache:
+    """用户身份缓存
+
+    进程内为短过期时间的 LRU 缓存，可选以 Redis 作为多进程共享的二级缓存。
+    缓存以令牌主体为键并记录令牌版本，版本不符的缓存视为未命中。
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, UserPrincipal]] = OrderedDict()
+
+    async def get(
+        self, subject: str, version: int, redis: Redis | None = None
+    ) -> UserPrincipal | None:
+        """获取指定令牌版本的用户身份"""
+        principal = self._get_local(subject)
+        if principal is None and redis is not None:
+            data = await redis.get(PRINCIPAL_KEY.format(subject=subject))
+            if data is not None:
+                principal = UserPrincipal.model_validate_json(data)
+                self._set_local(subject, principal)
+        if principal is None or principal.token_version != version:
+            return None
+        return principal
+
+    async def set(self, principal: UserPrincipal, redis: Redis | None = None):
+        """缓存用户身份"""
+        self._set_local(principal.username, principal)
+        if redis is not None:
+            await redis.set(
+                PRINCIPAL_KEY.format(subject=principal.username),
+                principal.model_dump_json(),
+                px=int(self.ttl * 1000),
+            )
+
+    async def invalidate(self, subject: str, redis: Redis | None = None):
+        """用户信息变更或令牌吊销后清除缓存
+
+        其他进程的进程内缓存最迟在过期时间后失效。
+        """
+        self._entries.pop(subject, None)
+        if redis is not None:
+            await redis.delete(PRINCIPAL_KEY.format(subject=subject))
+
+    def clear(self):
+        """清空进程内缓存"""
+        self._entries.clear()
+
+    def _get_local(self, subject: str) -> UserPrincipal | None:
+        entry = self._entries.get(subject)
+        if entry is None:
+            return None
+        expires_at, principal = entry
+        if expires_at < time.monotonic():
+            del self._entries[subject]
+            return None
+        self._entries.move_to_end(subject)
+        return principal
+
+    def _set_local(self, subject: str, principal: UserPrincipal):
+        self._entries[subject] = (time.monotonic() + self.ttl, principal)
+        self._entries.move_to_end(subject)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+principal_cache = PrincipalCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
@@ -0,0 +1,59 @@
+import time
+
+from redis.asyncio import Redis
+
+RATE_LIMIT_KEY = "kg:rate:{scope}:{key}:{window}"
+
+
+class RateLimiter:
+    """固定窗口计数的速率限制器
+
+    有 Redis 时在多个进程间共享计数，否则只在进程内计数。
+    """
+
+    def __init__(self, scope: str, limit: int, window: int):
+        """
+        Args:
+            scope: 限制的操作名，用于区分计数
+            limit: 每个窗口内允许的次数，0 表示不限制
+            window: 窗口长度 (秒)
+        """
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+        self._counts: dict[str, tuple[int, int]] = {}
+
+    async def hit(self, key: str, redis: Redis | None = None) -> int | None:
+        """记录一次操作
+
+        Returns:
+            超出限制时返回距窗口结束的秒数，否则返回 None
+        """
+        if self.limit <= 0:
+            return None
+        now = time.time()
+        window = int(now // self.window)
+        if redis is not None:
+            redis_key = RATE_LIMIT_KEY.format(scope=self.scope, key=key, window=window)
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.incr(redis_key)
+                pipe.expire(redis_key, self.window)
+                count, _ = await pipe.execute()
+        else:
+            count = self._hit_local(key, window)
+        if count <= self.limit:
+            return None
+        return max(1, int((window + 1) * self.window - now))
+
+    def clear(self):
+        """清空进程内计数"""
+        self._counts.clear()
+
+    def _hit_local(self, key: str, window: int) -> int:
+        current, count = self._counts.get(key, (window, 0))
+        if current != window:
+            count = 0
+            # 进入新窗口时丢弃过期的计数
+            self._counts = {k: v for k, v in self._counts.items() if v[0] == window}
+        self._counts[key] = (window, count + 1)
+        return count + 1
@@ -1,4 +1,11 @@
+import asyncio
+import os
+from email.utils import parsedate_to_datetime
 from functools import wraps
+from pathlib import Path
+
+from fastapi import Response
+from fastapi.responses import FileResponse
 
 from ..schemas.base import Result, ResultEnum
 
@@ -15,3 +22,66 @@ def to_response(func):
             return Result(code=ResultEnum.ERROR, message=str(e))
 
     return wrapper
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """判断 If-None-Match 请求头是否命中 ETag"""
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def not_modified(
+    if_none_match: str | None,
+    if_modified_since: str | None,
+    etag: str,
+    mtime: float,
+) -> bool:
+    """判断条件请求是否可以返回 304
+
+    If-None-Match 存在时只比较 ETag，否则比较 If-Modified-Since。
+    """
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since.timestamp()
+
+
+async def conditional_file_response(
+    path: Path,
+    if_none_match: str | None,
+    if_modified_since: str | None,
+    etag: str | None = None,
+    **kwargs,
+) -> Response:
+    """返回支持条件请求的文件响应
+
+    命中 ETag 或 Last-Modified 时返回 304；否则返回 FileResponse，由其处理
+    Range/If-Range 请求，服务器支持 pathsend 扩展时由内核直接发送文件。
+
+    Args:
+        etag: 预先计算的强 ETag，为空时根据文件修改时间和大小生成
+        kwargs: 传给 FileResponse 的其他参数
+    """
+    stat_result = await asyncio.to_thread(os.stat, path)
+    headers = kwargs.pop("headers", None) or {}
+    if etag is not None:
+        headers["ETag"] = etag
+    response = FileResponse(path, stat_result=stat_result, headers=headers, **kwargs)
+
+    if not_modified(
+        if_none_match, if_modified_since, response.headers["etag"], stat_result.st_mtime
+    ):
+        cached_headers = {
+            key: response.headers[key]
+            for key in ("etag", "last-modified", "vary", "cache-control")
+            if key in response.headers
+        }
+        return Response(status_code=304, headers=cached_headers)
+    return response
@@ -1,19 +1,66 @@
-from fastapi import Depends
+from uuid import uuid4
+
+from arq import ArqRedis
+from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..core.rate_limit import RateLimiter
 from ..database import get_db
+from ..schemas.user import UserPrincipal
 from ..services.auth import AuthService
+from ..settings import settings
+from .redis import get_cache_redis, get_optional_redis, get_rate_key
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
+login_limiter = RateLimiter(
+    "login", settings.LOGIN_RATE_LIMIT, settings.LOGIN_RATE_WINDOW
+)
 
 
-async def get_auth_svc(db: AsyncSession = Depends(get_db)) -> AuthService:
-    return AuthService(db)
+async def get_auth_svc(
+    db: AsyncSession = Depends(get_db),
+    redis: ArqRedis | None = Depends(get_cache_redis),
+) -> AuthService:
+    return AuthService(db, redis)
 
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     auth_svc: AuthService = Depends(get_auth_svc),
-):
+) -> UserPrincipal:
     return await auth_svc.get_current_user(token)
+
+
+async def get_bulk_rate_key(
+    token: str | None = Depends(optional_oauth2_scheme),
+    auth_svc: AuthService = Depends(get_auth_svc),
+) -> str:
+    """批量任务的限速键
+
+    已登录用户的所有批次共享同一配额；匿名提交时每个批次单独限速，
+    不同批次的任务在队列中交错执行。
+    """
+    if token:
+        try:
+            user = await auth_svc.get_current_user(token)
+        except HTTPException:
+            pass
+        else:
+            return f"user:{user.id}"
+    return f"batch:{uuid4().hex}"
+
+
+async def check_login_rate(
+    rate_key: str = Depends(get_rate_key),
+    redis: ArqRedis | None = Depends(get_optional_redis),
+):
+    """限制每个客户端的登录与注册频率，避免大量请求占满密码哈希线程"""
+    retry_after = await login_limiter.hit(rate_key, redis)
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(retry_after)},
+        )
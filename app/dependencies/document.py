@@ -1,6 +1,11 @@
+import asyncio
+import hashlib
 import uuid
 from pathlib import Path
+from typing import NamedTuple
 
+import aiofiles
+import aiofiles.os
 from fastapi import Depends, File, Form, HTTPException, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -24,42 +29,109 @@ async def get_doc(
         file: 上传的文件
         title: 文档标题
     """
+    file_type = _get_file_type(file)
+
+    # 保存文件并创建文档
+    saved_file = await _save_uploaded_file(file)
+
+    return DocCreate(
+        title=title,
+        local_file_name=saved_file.file_name,
+        file_type=file_type,
+    )
+
+
+async def get_docs(
+    files: list[UploadFile] = File(...),
+) -> list[tuple[str, DocCreate | HTTPException]]:
+    """解析批量上传的表单数据，并发保存所有文件
+
+    文档标题取文件名，单个文件失败时在对应位置返回错误而不影响其他文件。
+
+    Args:
+        files: 上传的文件列表
+
+    Returns:
+        按上传顺序排列的 (文件名, 文档创建数据或错误) 列表
+    """
+
+    async def _save(file: UploadFile) -> DocCreate:
+        file_type = _get_file_type(file)
+        saved_file = await _save_uploaded_file(file)
+        assert file.filename is not None
+        return DocCreate(
+            title=Path(file.filename).stem,
+            local_file_name=saved_file.file_name,
+            file_type=file_type,
+        )
+
+    results = await asyncio.gather(
+        *(_save(file) for file in files), return_exceptions=True
+    )
+    return [
+        (
+            file.filename or "",
+            (
+                result
+                if isinstance(result, (DocCreate, HTTPException))
+                else HTTPException(status_code=400, detail=str(result))
+            ),
+        )
+        for file, result in zip(files, results)
+    ]
+
+
+def _get_file_type(file: UploadFile) -> FileType:
+    """根据文件名获取文件类型"""
     if not file.filename:
         raise HTTPException(status_code=400, detail="File name is required")
 
     file_type = file.filename.split(".")[-1]
 
     try:
-        file_type = FileType(file_type)
+        return FileType(file_type)
     except ValueError:
         raise HTTPException(
             status_code=400, detail=f"Unsupported file type: {file_type}"
         )
 
-    # 保存文件并创建文档
-    saved_filename = await _save_uploaded_file(file)
 
-    return DocCreate(
-        title=title,
-        local_file_name=saved_filename,
-        file_type=file_type,
-    )
+class SavedFile(NamedTuple):
+    """已保存的上传文件"""
 
+    file_name: str
+    sha256: str
+    size: int
 
-async def _save_uploaded_file(file: UploadFile):
-    """保存上传的文件到指定目录"""
-    assert file.filename is not None
-    file_name = _get_unique_filename(file.filename)
-    file_path = settings.UPLOAD_DIR / file_name
-    file_path.parent.mkdir(parents=True, exist_ok=True)
-
-    content = await file.read()
-    file_path.write_bytes(content)
 
-    return file_path.stem
+async def _save_uploaded_file(file: UploadFile) -> SavedFile:
+    """分块流式保存上传的文件到指定目录
 
+    先写入同目录下的临时文件，写入过程中计算内容哈希和文件大小，
+    内存占用与文件大小无关。写完后以内容哈希为文件名原子重命名，
+    内容相同的文件只保存一份。
+    """
+    assert file.filename is not None
+    suffix = Path(file.filename).suffix
+    await aiofiles.os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    tmp_path = settings.UPLOAD_DIR / f".{uuid.uuid4().hex}.part"
 
-def _get_unique_filename(original_name: str):
-    """生成唯一文件名 - 私有辅助方法"""
-    path = Path(original_name)
-    return Path(f"{path.stem}_{uuid.uuid4().hex[:8]}{path.suffix}")
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+                sha256.update(chunk)
+                size += len(chunk)
+                await out.write(chunk)
+
+        file_path = settings.UPLOAD_DIR / f"{sha256.hexdigest()}{suffix}"
+        if await aiofiles.os.path.exists(file_path):
+            await aiofiles.os.remove(tmp_path)
+        else:
+            await aiofiles.os.replace(tmp_path, file_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    return SavedFile(file_path.stem, sha256.hexdigest(), size)
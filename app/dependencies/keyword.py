@@ -1,42 +1,84 @@
-from io import BytesIO, StringIO
+import asyncio
+from typing import AsyncIterator, Iterable, Iterator
 
 import pandas as pd
+from arq import ArqRedis
 from fastapi import Depends, File, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..database import get_db
-from ..schemas.keyword import KeywordCreate
+from ..schemas.subject import Subject
 from ..services import DocKeywordService, KeywordService
+from ..settings import settings
+from .redis import get_optional_redis
+
+SUBJECTS = {subject.value: subject for subject in Subject}
 
 
 async def get_kw_svc(db: AsyncSession = Depends(get_db)):
     return KeywordService(db)
 
 
-async def get_doc_kw_svc(db: AsyncSession = Depends(get_db)):
-    return DocKeywordService(db)
+async def get_doc_kw_svc(
+    db: AsyncSession = Depends(get_db),
+    redis: ArqRedis | None = Depends(get_optional_redis),
+):
+    return DocKeywordService(db, redis)
 
 
 async def get_keywords(
     file: UploadFile = File(...),
-) -> list[KeywordCreate]:
-    """从上传的文件中读取关键词列表"""
-    assert file.filename, "文件名不能为空"
+) -> AsyncIterator[tuple[list[dict], int, int]]:
+    """从上传的文件中按块读取关键词
 
-    content = await file.read()
+    CSV 文件流式解析，XLSX 文件整体解析后分块。每块按列校验名称与学科并
+    在块内去重，与之前块重复的名称在插入时作为已存在的关键词跳过。
+
+    Returns:
+        逐块产出 (关键词字段列表, 无效行数, 文件内重复行数) 的异步迭代器
+    """
+    assert file.filename, "文件名不能为空"
 
     file_type = file.filename.rsplit(".", 1)[-1].lower()
+    chunk_size = settings.KEYWORD_IMPORT_CHUNK_SIZE
+    frames: Iterable[pd.DataFrame]
     match file_type:
         case "csv":
-            df = pd.read_csv(StringIO(content.decode()), header=None)
+            frames = pd.read_csv(
+                file.file, header=None, dtype=str, chunksize=chunk_size
+            )
         case "xlsx":
-            df = pd.read_excel(BytesIO(content), header=None)
+            df: pd.DataFrame = await asyncio.to_thread(
+                pd.read_excel, file.file, sheet_name=0, header=None, dtype=str
+            )
+            frames = (
+                df.iloc[start : start + chunk_size]
+                for start in range(0, len(df), chunk_size)
+            )
         case _:
             raise ValueError("不支持的文件类型")
 
-    if df.shape[1] < 2:
-        raise ValueError("文件必须至少包含两列")
+    return _iter_keyword_chunks(iter(frames))
+
+
+async def _iter_keyword_chunks(
+    frames: Iterator[pd.DataFrame],
+) -> AsyncIterator[tuple[list[dict], int, int]]:
+    """在线程中逐块解析文件，产出校验并去重后的关键词"""
+    while (df := await asyncio.to_thread(next, frames, None)) is not None:
+        if df.shape[1] < 2:
+            raise ValueError("文件必须至少包含两列")
+
+        names = df[0].str.strip()
+        subjects = df[1].str.strip()
+        valid = names.notna() & (names != "") & subjects.isin(SUBJECTS)
+        names, subjects = names[valid], subjects[valid]
 
-    keywords = [KeywordCreate(name=row[0], subject=row[1]) for _, row in df.iterrows()]
+        duplicated = names.duplicated()
+        names, subjects = names[~duplicated], subjects[~duplicated]
 
-    return keywords
+        values = [
+            {"name": name, "subject": subject}
+            for name, subject in zip(names.tolist(), subjects.map(SUBJECTS).tolist())
+        ]
+        yield values, int((~valid).sum()), int(duplicated.sum())
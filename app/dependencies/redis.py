@@ -1,7 +1,30 @@
 from arq import ArqRedis
-from fastapi import Request
+from fastapi import Depends, Request
+
+from ..settings import settings
 
 
 async def get_redis(request: Request) -> ArqRedis:
     """获取 Redis 连接池"""
     return request.app.state.redis
+
+
+async def get_optional_redis(request: Request) -> ArqRedis | None:
+    """获取 Redis 连接池，未连接 (如测试中) 时返回 None"""
+    return getattr(request.app.state, "redis", None)
+
+
+async def get_cache_redis(
+    redis: ArqRedis | None = Depends(get_optional_redis),
+) -> ArqRedis | None:
+    """获取用作共享缓存的 Redis 连接池，未连接或未启用时返回 None"""
+    return redis if settings.AUTH_CACHE_REDIS else None
+
+
+async def get_rate_key(request: Request) -> str:
+    """获取速率限制的客户端标识
+
+    登录和注册接口在认证之前调用，以客户端地址区分提交者。
+    """
+    client = request.client
+    return f"client:{client.host}" if client else "client:unknown"
@@ -1,3 +1,3 @@
 from .document import Document
-from .graph import Edge
-from .keyword import Keyword
+from .graph import DocRelation, Edge, GraphVersion
+from .keyword import Keyword, document_keyword_counts, document_keywords
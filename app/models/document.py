@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+import asyncio
 from datetime import datetime
 from typing import TYPE_CHECKING
 
 import aiofiles
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
+from ..core import compression
 from ..database import Base
 from ..schemas.document import DocState, FileType
 from ..settings import settings
@@ -20,10 +22,15 @@ class Document(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     title: Mapped[str] = mapped_column(nullable=False)
-    local_file_name: Mapped[str] = mapped_column(nullable=False)
+    # 上传文件内容的 SHA-256，内容相同的文档共享上传文件和文本文件
+    local_file_name: Mapped[str] = mapped_column(nullable=False, index=True)
     file_type: Mapped[FileType] = mapped_column(nullable=False)
     state: Mapped[DocState] = mapped_column(default=DocState.UPLOADED, nullable=False)
     word_count: Mapped[int | None] = mapped_column(default=None)
+    graph_synced: Mapped[bool] = mapped_column(default=False, nullable=False)
+    # 各处理阶段输入 (内容哈希、配置、kgtools 版本) 的指纹，用于跳过未变化的阶段
+    extract_fingerprint: Mapped[str | None] = mapped_column(default=None)
+    normalize_fingerprint: Mapped[str | None] = mapped_column(default=None)
     created_at: Mapped[datetime] = mapped_column(default=datetime.now, nullable=False)
     updated_at: Mapped[datetime] = mapped_column(
         default=datetime.now, onupdate=datetime.now, nullable=False
@@ -38,7 +45,7 @@ class Document(Base):
     @property
     def file_name(self):
         """获取文件名"""
-        return f"{self.title}.{self.file_type}"
+        return f"{self.title}.{self.file_type.value}"
 
     @property
     def file_size(self):
@@ -48,7 +55,7 @@ class Document(Base):
     @property
     def upload_path(self):
         """获取原始上传文件路径"""
-        return settings.UPLOAD_DIR / f"{self.local_file_name}.{self.file_type}"
+        return settings.UPLOAD_DIR / f"{self.local_file_name}.{self.file_type.value}"
 
     @property
     def extracted_path(self):
@@ -60,6 +67,11 @@ class Document(Base):
         """获取标准化文本的文件路径"""
         return settings.NORM_TEXT_DIR / f"{self.local_file_name}.txt"
 
+    @property
+    def page_cache_dir(self):
+        """获取逐页提取结果的缓存目录"""
+        return settings.PAGE_CACHE_DIR / self.local_file_name
+
     @property
     def url(self):
         """获取文档的下载URL"""
@@ -81,28 +93,43 @@ class Document(Base):
             file_path = self.get_path(state)
             file_path.parent.mkdir(parents=True, exist_ok=True)
 
-    def delete_dirs(self):
-        """删除文档所需的所有目录"""
-        for state in DocState:
-            if not state.is_finished:
-                continue
-            file_path = self.get_path(state)
-            file_path.unlink(missing_ok=True)
+    def find_path(self, state: DocState):
+        """获取实际存储的文件路径，文本文件可能以任一压缩格式存储"""
+        file_path = self.get_path(state)
+        if state == DocState.UPLOADED:
+            return file_path
+        for variant in compression.get_variants(file_path):
+            if variant.exists():
+                return variant
+        return file_path
 
     async def read_text(self, state: DocState) -> str:
-        """读取文档文本"""
-        file_path = self.get_path(state)
+        """读取文档文本，压缩存储时流式解压"""
+        file_path = self.find_path(state)
+        if compression.get_path_codec(file_path) != "none":
+            return await asyncio.to_thread(compression.read_text, file_path)
         async with aiofiles.open(file_path, "r", encoding="utf-8") as file:
             return await file.read()
 
     async def write_text(self, text: str, state: DocState):
-        """写入文档文本并更新状态"""
+        """按当前配置的压缩格式写入文档文本并更新状态"""
         if self.state < state:
             self.state = state
 
-        file_path = self.get_path(state)
-        async with aiofiles.open(file_path, "w", encoding="utf-8") as file:
-            await file.write(text)
+        codec = compression.get_codec()
+        base_path = self.get_path(state)
+        file_path = compression.with_codec(base_path, codec)
+        if codec == "none":
+            async with aiofiles.open(file_path, "w", encoding="utf-8") as file:
+                await file.write(text)
+        else:
+            await asyncio.to_thread(compression.write_text, file_path, text, codec)
+
+        # 删除以其他格式存储的旧文件，避免读到过期内容
+        for variant in compression.get_variants(base_path):
+            if variant != file_path:
+                variant.unlink(missing_ok=True)
 
         if state == DocState.NORMALIZED:
             self.word_count = len(text)
+            self.graph_synced = False
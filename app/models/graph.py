@@ -1,12 +1,54 @@
+from datetime import datetime
+
+from sqlalchemy import Index
 from sqlalchemy.orm import Mapped, mapped_column
 
 from ..database import Base
 
 
+class GraphVersion(Base):
+    """图谱版本，任一时刻只有一个版本处于激活状态"""
+
+    __tablename__ = "graph_versions"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    is_active: Mapped[bool] = mapped_column(default=False, nullable=False)
+    # 增量更新次数，与 id 一起标识图谱内容
+    revision: Mapped[int] = mapped_column(default=0, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.now, nullable=False)
+
+    @property
+    def tag(self) -> str:
+        """图谱内容标识，用作缓存键和 ETag"""
+        return f"{self.id}.{self.revision}"
+
+
 class Edge(Base):
     __tablename__ = "edges"
+    __table_args__ = (
+        # 同一版本中每对关键词只有一条边，增量更新据此合并权重；
+        # 同时服务于按 source 查询
+        Index("ix_edges_version_pair", "version", "source", "target", unique=True),
+        Index("ix_edges_version_target", "version", "target"),
+        Index("ix_edges_version_weight", "version", "weight"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    version: Mapped[int] = mapped_column(nullable=False)
     source: Mapped[int] = mapped_column(nullable=False)
     target: Mapped[int] = mapped_column(nullable=False)
     weight: Mapped[float] = mapped_column(nullable=True)
+
+
+class DocRelation(Base):
+    """单个文档对关系矩阵的贡献，用于增量更新图谱
+
+    document_id 不设外键，文档删除后贡献仍保留，直到图谱任务将其扣除。
+    """
+
+    __tablename__ = "doc_relations"
+
+    document_id: Mapped[int] = mapped_column(primary_key=True)
+    source: Mapped[int] = mapped_column(primary_key=True)
+    target: Mapped[int] = mapped_column(primary_key=True)
+    weight: Mapped[float] = mapped_column(nullable=False)
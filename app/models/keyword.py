@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-from sqlalchemy import Column, ForeignKey, Table
+from sqlalchemy import Column, ForeignKey, Integer, Table
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from ..database import Base
@@ -19,6 +19,24 @@ document_keywords = Table(
     Column("keyword_id", ForeignKey("keywords.id"), primary_key=True),
 )
 
+# 关键词在各文档标准化文本中的出现次数，未出现的关键词不存储
+document_keyword_counts = Table(
+    "document_keyword_counts",
+    Base.metadata,
+    Column(
+        "document_id",
+        ForeignKey("documents.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "keyword_id",
+        ForeignKey("keywords.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    ),
+    Column("count", Integer, nullable=False),
+)
+
 
 class Keyword(Base):
     __tablename__ = "keywords"
@@ -26,6 +44,8 @@ class Keyword(Base):
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     name: Mapped[str] = mapped_column(nullable=False, unique=True)
     subject: Mapped[Subject] = mapped_column(nullable=False)
+    # 是否已统计该关键词在所有文档中的出现次数
+    indexed: Mapped[bool] = mapped_column(default=False, nullable=False)
 
     documents: Mapped[set[Document]] = relationship(
         "Document",
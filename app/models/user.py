@@ -14,3 +14,5 @@ class User(Base):
     desc: Mapped[str | None]
     role_name: Mapped[str]
     role_value: Mapped[str]
+    # 令牌版本，递增后此前签发的令牌全部失效
+    token_version: Mapped[int] = mapped_column(default=0, server_default="0")
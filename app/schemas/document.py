@@ -3,6 +3,8 @@ from enum import Enum
 
 from pydantic import BaseModel, ConfigDict, Field, field_validator
 
+from .subject import Subject
+
 
 class FileType(str, Enum):
     PDF = "pdf"
@@ -65,6 +67,35 @@ class FileUploadResult(BaseModel):
     fileName: str = Field(..., description="文件名")
 
 
+class DocFilter(BaseModel):
+    """批量处理文档的筛选条件，多个条件同时生效"""
+
+    ids: list[int] | None = Field(None, description="文档ID列表")
+    subject: list[Subject] | None = Field(None, description="关键词所属学科列表")
+    state: DocState | None = Field(None, description="文档状态")
+
+
+class DocUploadItem(BaseModel):
+    """批量上传创建的文档"""
+
+    id: int = Field(..., description="文档ID")
+    title: str = Field(..., description="文档标题")
+    state: DocState = Field(..., description="文档状态")
+
+    model_config = ConfigDict(
+        from_attributes=True,
+    )
+
+
+class DocUploadResult(BaseModel):
+    """批量上传中单个文件的结果"""
+
+    success: bool = Field(..., description="是否上传成功")
+    fileName: str = Field(..., description="上传的文件名")
+    document: DocUploadItem | None = Field(None, description="创建的文档")
+    error: str | None = Field(None, description="错误信息")
+
+
 class DocItem(BaseModel):
     """文档列表项"""
 
@@ -19,3 +19,11 @@ class KeywordItem(KeywordBase):
 
     id: int = Field(..., description="关键词ID", examples=[1])
     model_config = ConfigDict(from_attributes=True)
+
+
+class KeywordImportResult(BaseModel):
+    """关键词导入结果"""
+
+    inserted: int = Field(0, description="新增的关键词数量")
+    skipped: int = Field(0, description="文件内重复或已存在而跳过的数量")
+    invalid: int = Field(0, description="名称为空或学科无效的行数")
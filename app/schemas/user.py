@@ -35,3 +35,17 @@ class RegisterParams(BaseModel):
 class RegisterResult(BaseModel):
     userId: str
     username: str
+
+
+class UserPrincipal(BaseModel):
+    """已认证用户的身份信息，缓存后免去每次请求查询数据库"""
+
+    id: int
+    username: str
+    real_name: str
+    avatar: str
+    desc: str | None = None
+    role_name: str
+    role_value: str
+    perm_codes: list[str]
+    token_version: int
@@ -1,14 +1,24 @@
 from datetime import datetime, timedelta
+from functools import partial
 
 from fastapi import HTTPException, status
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy import select
+from redis.asyncio import Redis
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..core.executor import run_password_hash
+from ..core.principal_cache import principal_cache
 from ..database import transaction
 from ..models.user import User
-from ..schemas.user import LoginParams, LoginResult, RegisterParams, RoleInfo
+from ..schemas.user import (
+    LoginParams,
+    LoginResult,
+    RegisterParams,
+    RoleInfo,
+    UserPrincipal,
+)
 from ..settings import settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -19,8 +29,13 @@ PERM_CODES = {
 
 
 class AuthService:
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, redis: Redis | None = None):
+        """
+        Args:
+            redis: 用户身份的共享缓存，为空时只使用进程内缓存
+        """
         self.db = db
+        self.redis = redis
 
     async def login(self, params: LoginParams) -> LoginResult | None:
         """用户登录"""
@@ -28,14 +43,17 @@ class AuthService:
             select(User).where(User.username == params.username)
         )
         user = result.scalar_one_or_none()
-        if not user or not self.verify_password(params.password, user.password):
+        if not user or not await run_password_hash(
+            partial(self.verify_password, params.password, user.password)
+        ):
             return None
 
         access_token_expires = timedelta(
             minutes=settings.JWT_ACCESS_TOKEN_EXPIRE_MINUTES
         )
         access_token = self.create_access_token(
-            data={"sub": user.username}, expires_delta=access_token_expires
+            data={"sub": user.username, "ver": user.token_version},
+            expires_delta=access_token_expires,
         )
 
         return LoginResult(
@@ -57,7 +75,9 @@ class AuthService:
 
         user = User(
             username=params.username,
-            password=self.get_password_hash(params.password),
+            password=await run_password_hash(
+                partial(self.get_password_hash, params.password)
+            ),
             real_name=params.real_name,
             avatar="https://q1.qlogo.cn/g?b=qq&nk=339449197&s=640",
             desc="New User",
@@ -71,8 +91,11 @@ class AuthService:
         await self.db.refresh(user)
         return user
 
-    async def get_current_user(self, token: str) -> User:
-        """获取当前用户"""
+    async def get_current_user(self, token: str) -> UserPrincipal:
+        """获取当前用户
+
+        先按令牌主体和版本查找缓存的用户身份，未命中时才查询数据库。
+        """
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -85,14 +108,50 @@ class AuthService:
             username: str | None = payload.get("sub")
             if username is None:
                 raise credentials_exception
-        except JWTError:
+            # 未携带版本的旧令牌视为初始版本
+            version = int(payload.get("ver", 0))
+        except (JWTError, TypeError, ValueError):
             raise credentials_exception
 
+        principal = await principal_cache.get(username, version, self.redis)
+        if principal is not None:
+            return principal
+
         result = await self.db.execute(select(User).where(User.username == username))
         user = result.scalar_one_or_none()
-        if user is None:
+        if user is None or user.token_version != version:
             raise credentials_exception
-        return user
+
+        principal = UserPrincipal(
+            id=user.id,
+            username=user.username,
+            real_name=user.real_name,
+            avatar=user.avatar,
+            desc=user.desc,
+            role_name=user.role_name,
+            role_value=user.role_value,
+            perm_codes=self.get_perm_codes(user.role_value),
+            token_version=user.token_version,
+        )
+        await principal_cache.set(principal, self.redis)
+        return principal
+
+    async def revoke_tokens(self, username: str):
+        """吊销用户已签发的全部令牌，所有设备上的登录一并失效
+
+        供修改密码等需要强制下线的场景使用，退出登录不调用。
+        """
+        async with transaction(self.db):
+            await self.db.execute(
+                update(User)
+                .where(User.username == username)
+                .values(token_version=User.token_version + 1)
+            )
+        await self.invalidate_user(username)
+
+    async def invalidate_user(self, username: str):
+        """清除用户身份缓存，修改用户信息后调用"""
+        await principal_cache.invalidate(username, self.redis)
 
     @staticmethod
     def get_perm_codes(role_value: str) -> list[str]:
@@ -1,18 +1,33 @@
+import asyncio
+from typing import AsyncIterable
+
+from arq import ArqRedis
+from sqlalchemy import delete, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..core.bulk import bulk_insert, conflict_insert, iter_chunks
+from ..core.jobs import GRAPH_QUEUE
+from ..core.matcher import KeywordMatcher
 from ..database import transaction
-from ..models import Document
-from ..schemas.keyword import KeywordCreate
+from ..models import Document, Keyword, document_keyword_counts, document_keywords
 from ..schemas.subject import Subject
+from ..settings import settings
 from .document import DocService
 from .keyword import KeywordService
 
+KEYWORD_COUNT_COLUMNS = ("document_id", "keyword_id", "count")
+
 
 class DocKeywordService:
     """处理文档和关键词之间的关联关系"""
 
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, redis: ArqRedis | None = None):
+        """
+        Args:
+            redis: 任务队列，新建关键词后提交 index_keywords；为空时不提交
+        """
         self.db = db
+        self.redis = redis
         self.doc_svc = DocService(db)
         self.kw_svc = KeywordService(db)
 
@@ -24,18 +39,127 @@ class DocKeywordService:
         if doc is None:
             return None
 
-        new_keywords = set()
-        for name in keyword_names:
-            keyword = await self.kw_svc.get_keyword_by_name(name)
-            if keyword is None:
-                keyword = await self.kw_svc.create_keyword(
-                    KeywordCreate(name=name, subject=subject)
-                )
-            new_keywords.add(keyword)
+        await self.create_keywords_for_docs({doc_id: keyword_names}, subject)
 
+        await self.db.refresh(doc)
         await self.db.refresh(doc, ["keywords"])
+        return doc
+
+    async def create_keywords_for_docs(
+        self, doc_keywords: dict[int, list[str]], subject: Subject
+    ) -> int:
+        """批量为多个文档关联关键词，不存在的关键词以指定学科创建
+
+        所有名称一次解析为关键词ID，关联记录批量插入并跳过已有的关联，
+        全部在同一事务中完成。不存在的文档被忽略。确实新建了关键词时，
+        提交后与 create_keyword 一样提交 index_keywords 统计其出现次数。
+
+        Args:
+            doc_keywords: 文档ID到关键词名称列表的映射
+
+        Returns:
+            新增的关联数量
+        """
         async with transaction(self.db):
-            doc.keywords |= new_keywords
+            result = await self.db.execute(
+                select(Document.id).where(Document.id.in_(list(doc_keywords)))
+            )
+            doc_ids = set(result.scalars())
+            keyword_ids, inserted = await self.kw_svc.get_or_create_keywords(
+                (name for doc_id in doc_ids for name in doc_keywords[doc_id]),
+                subject,
+            )
+            values = [
+                {"document_id": doc_id, "keyword_id": keyword_id}
+                for doc_id in doc_ids
+                for keyword_id in {keyword_ids[name] for name in doc_keywords[doc_id]}
+            ]
+            linked = 0
+            if values:
+                stmt = await conflict_insert(self.db, document_keywords)
+                stmt = (
+                    stmt.on_conflict_do_nothing()
+                    .returning(document_keywords.c.document_id)
+                    .execution_options(
+                        insertmanyvalues_page_size=settings.KEYWORD_IMPORT_CHUNK_SIZE
+                    )
+                )
+                result = await self.db.execute(stmt, values)
+                linked = len(result.all())
 
-        await self.db.refresh(doc)
-        return doc
+        if inserted and self.redis is not None:
+            await self.redis.enqueue_job("index_keywords", _queue_name=GRAPH_QUEUE)
+        return linked
+
+    async def get_keyword_counts(self, doc_id: int) -> dict[int, int]:
+        """获取文档中各关键词的出现次数"""
+        result = await self.db.execute(
+            select(
+                document_keyword_counts.c.keyword_id, document_keyword_counts.c.count
+            ).where(document_keyword_counts.c.document_id == doc_id)
+        )
+        return dict(result.all())
+
+    async def set_keyword_counts(self, doc_id: int, counts: dict[int, int]):
+        """覆盖文档中各关键词的出现次数"""
+        async with transaction(self.db):
+            await self.db.execute(
+                delete(document_keyword_counts).where(
+                    document_keyword_counts.c.document_id == doc_id
+                )
+            )
+            await bulk_insert(
+                self.db,
+                document_keyword_counts,
+                KEYWORD_COUNT_COLUMNS,
+                ((doc_id, keyword_id, count) for keyword_id, count in counts.items()),
+            )
+
+    async def index_keywords(
+        self, keywords: dict[int, str], docs: AsyncIterable[tuple[int, str]]
+    ) -> int:
+        """统计新增关键词在各文档中的出现次数
+
+        出现这些关键词的文档会被标记为需要重新计入图谱。
+
+        Args:
+            keywords: 待统计的关键词 ID 到名称的映射
+            docs: 逐个产出 (文档 ID, 标准化文本) 的异步迭代器
+
+        Returns:
+            出现这些关键词的文档数量
+        """
+        matcher = KeywordMatcher(keywords)
+        records: list[tuple[int, int, int]] = []
+        async for doc_id, text in docs:
+            counts = await asyncio.to_thread(matcher.count_ids, text)
+            records.extend(
+                (doc_id, keyword_id, count) for keyword_id, count in counts.items()
+            )
+        doc_ids = {doc_id for doc_id, _, _ in records}
+
+        # IN 条件按块拆分，避免大量关键词超出数据库的参数数量上限
+        size = settings.KEYWORD_IMPORT_CHUNK_SIZE
+        async with transaction(self.db):
+            for keyword_ids in iter_chunks(keywords, size):
+                await self.db.execute(
+                    delete(document_keyword_counts).where(
+                        document_keyword_counts.c.keyword_id.in_(keyword_ids)
+                    )
+                )
+            await bulk_insert(
+                self.db, document_keyword_counts, KEYWORD_COUNT_COLUMNS, records
+            )
+            for keyword_ids in iter_chunks(keywords, size):
+                await self.db.execute(
+                    update(Keyword)
+                    .where(Keyword.id.in_(keyword_ids))
+                    .values(indexed=True)
+                )
+            for doc_chunk in iter_chunks(doc_ids, size):
+                await self.db.execute(
+                    update(Document)
+                    .where(Document.id.in_(doc_chunk))
+                    .values(graph_synced=False)
+                )
+        return len(doc_ids)
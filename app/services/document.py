@@ -1,11 +1,72 @@
+import asyncio
+import hashlib
+import json
+import shutil
+from functools import partial
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Iterable
+
+import aiofiles
+import aiofiles.os
 from kgtools.preprocessing import extract_text, normalize_text
 from kgtools.schemas.preprocessing import ExtractConfig, NormalizeConfig
-from sqlalchemy import func, select
+from pdf2image import pdfinfo_from_path
+from sqlalchemy import ColumnElement, delete, func, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
+from ..core import compression
+from ..core.executor import run_in_process
 from ..database import transaction
-from ..models import Document
-from ..schemas.document import DocCreate, DocItem, DocState
+from ..models import Document, Keyword, document_keyword_counts, document_keywords
+from ..schemas.document import DocCreate, DocFilter, DocItem, DocState, FileType
+from ..settings import settings
+
+try:
+    KGTOOLS_VERSION = version("kgtools")
+except PackageNotFoundError:
+    KGTOOLS_VERSION = "unknown"
+
+
+def _get_page_count(path: Path) -> int:
+    """获取 PDF 页数"""
+    return pdfinfo_from_path(str(path))["Pages"]
+
+
+def _get_config_hash(config: ExtractConfig) -> str:
+    """计算影响单页提取结果的配置哈希，页码范围和并行度不参与计算
+
+    kgtools 版本参与计算，升级后不会复用旧版本的单页缓存。
+    """
+    data = config.model_dump_json(exclude={"first_page", "last_page", "num_workers"})
+    data = f"{KGTOOLS_VERSION}:{data}"
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+
+def _get_fingerprint(*parts) -> str:
+    """计算处理阶段的输入指纹，kgtools 版本变化时指纹随之变化"""
+    data = json.dumps([KGTOOLS_VERSION, *parts], sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _get_processed_fields(source: Document) -> dict:
+    """获取内容相同的文档可以直接复用的处理结果字段"""
+    return {
+        "state": source.state,
+        "word_count": source.word_count,
+        "extract_fingerprint": source.extract_fingerprint,
+        "normalize_fingerprint": source.normalize_fingerprint,
+    }
+
+
+def _remove_paths(paths: Iterable[Path]):
+    """删除文件或目录"""
+    for path in paths:
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
 
 
 class DocService:
@@ -13,49 +74,337 @@ class DocService:
         self.db = db
 
     async def create_doc(self, doc_create: DocCreate):
-        """创建文档"""
+        """创建文档
+
+        已有内容相同的文档时直接复用其处理结果，无需重新提取和标准化。
+        """
         db_doc = Document(**doc_create.model_dump())
         db_doc.create_dirs()
+        copies = await self._get_processed_copies([db_doc.local_file_name])
+        source = copies.get(db_doc.local_file_name)
+        unshared_paths = await self._get_unshared_paths(db_doc)
         try:
             async with transaction(self.db):
+                if source is not None:
+                    for key, value in _get_processed_fields(source).items():
+                        setattr(db_doc, key, value)
                 self.db.add(db_doc)
+                await self.db.flush()
+                if source is not None:
+                    await self._copy_keyword_counts([source.id], [db_doc.id])
 
             await self.db.refresh(db_doc)
             return db_doc
 
         except Exception as e:
-            db_doc.delete_dirs()
+            _remove_paths(unshared_paths)
             raise e
 
-    async def extract_doc(self, doc_id: int, config: ExtractConfig):
-        """提取文档内容"""
+    async def create_docs(self, doc_creates: list[DocCreate]):
+        """批量创建文档，所有文档在一条 INSERT 语句中写入
+
+        与 create_doc 相同，已有内容相同的文档时直接复用其处理结果。
+
+        Returns:
+            按输入顺序排列的 (id, title, state) 行
+        """
+        if not doc_creates:
+            return []
+
+        values = [doc_create.model_dump() for doc_create in doc_creates]
+        copies = await self._get_processed_copies(v["local_file_name"] for v in values)
+        sources = [copies.get(v["local_file_name"]) for v in values]
+        for v, source in zip(values, sources):
+            if source is not None:
+                v.update(_get_processed_fields(source))
+        Document(**values[0]).create_dirs()
+
+        try:
+            async with transaction(self.db):
+                result = await self.db.execute(
+                    insert(Document).returning(
+                        Document.id,
+                        Document.title,
+                        Document.state,
+                        sort_by_parameter_order=True,
+                    ),
+                    values,
+                )
+                rows = result.all()
+                await self._copy_keyword_counts(
+                    {source.id for source in sources if source is not None},
+                    [
+                        row.id
+                        for row, source in zip(rows, sources)
+                        if source is not None
+                    ],
+                )
+            return rows
+
+        except Exception as e:
+            for v in values:
+                _remove_paths(await self._get_unshared_paths(Document(**v)))
+            raise e
+
+    async def _get_processed_copies(
+        self, local_file_names: Iterable[str]
+    ) -> dict[str, Document]:
+        """获取每种内容处理进度最靠后的文档"""
+        result = await self.db.execute(
+            select(Document).where(
+                Document.local_file_name.in_(set(local_file_names)),
+                Document.state.in_([DocState.EXTRACTED, DocState.NORMALIZED]),
+            )
+        )
+        copies: dict[str, Document] = {}
+        for doc in result.scalars():
+            copy = copies.get(doc.local_file_name)
+            if copy is None or copy.state < doc.state:
+                copies[doc.local_file_name] = doc
+        return copies
+
+    async def _copy_keyword_counts(
+        self, source_ids: Iterable[int], target_ids: Iterable[int]
+    ):
+        """复制内容相同的文档的关键词出现次数
+
+        每个目标文档按 local_file_name 匹配到其来源文档，所有目标文档在
+        一条 INSERT ... SELECT 语句中复制。
+        """
+        source_ids, target_ids = list(source_ids), list(target_ids)
+        if not target_ids:
+            return
+        source = aliased(Document)
+        columns = document_keyword_counts.c
+        await self.db.execute(
+            insert(document_keyword_counts).from_select(
+                ["document_id", "keyword_id", "count"],
+                select(Document.id, columns.keyword_id, columns.count)
+                .join(source, source.local_file_name == Document.local_file_name)
+                .join(document_keyword_counts, columns.document_id == source.id)
+                .where(Document.id.in_(target_ids), source.id.in_(source_ids)),
+            )
+        )
+
+    async def get_shared_doc_ids(self, doc_id: int) -> list[int]:
+        """获取与该文档内容相同的其他文档 ID"""
+        doc = await self.get_doc(doc_id)
+        if doc is None:
+            return []
+        result = await self.db.execute(
+            select(Document.id).where(
+                Document.local_file_name == doc.local_file_name,
+                Document.id != doc_id,
+            )
+        )
+        return list(result.scalars().all())
+
+    async def extract_doc(
+        self,
+        doc_id: int,
+        config: ExtractConfig,
+        next_state: DocState | None = None,
+    ) -> str | None:
+        """提取文档内容，返回提取的文本
+
+        上传内容、配置和 kgtools 版本都与上次提取相同时跳过提取，返回 None。
+
+        Args:
+            next_state: 写入提取结果的同时切换到的状态，用于紧接着标准化
+        """
         doc = await self.get_doc(doc_id)
         if not doc:
             raise ValueError(f"Document {doc_id} not found")
 
-        text = extract_text(
-            doc.upload_path,
-            file_type=doc.file_type,
-            **config.model_dump(),
+        fingerprint = _get_fingerprint(
+            doc.local_file_name, config.model_dump(mode="json", exclude={"num_workers"})
         )
+        if (
+            doc.extract_fingerprint == fingerprint
+            and doc.find_path(DocState.EXTRACTED).exists()
+        ):
+            return None
+
+        if doc.file_type == FileType.PDF:
+            text = await self._extract_pdf(doc, config)
+        else:
+            text = await run_in_process(
+                partial(
+                    extract_text,
+                    doc.upload_path,
+                    file_type=doc.file_type,
+                    **config.model_dump(),
+                ),
+                timeout=settings.EXTRACT_TIMEOUT,
+            )
 
         async with transaction(self.db):
             await doc.write_text(text, DocState.EXTRACTED)
+            if next_state is not None:
+                doc.state = next_state
+            # 提取文本由内容相同的文档共享，指纹随文件一起更新
+            await self.db.execute(
+                update(Document)
+                .where(Document.local_file_name == doc.local_file_name)
+                .values(extract_fingerprint=fingerprint)
+            )
+        return text
+
+    async def _extract_pdf(self, doc: Document, config: ExtractConfig) -> str:
+        """按页并行提取 PDF 文本
+
+        每页作为独立任务提交到进程池，同时提取的页数不超过进程数，结果按
+        (内容哈希, 配置哈希, 页码) 缓存。修改配置或提取失败后重新提取时，
+        只处理没有缓存的页。任一页失败时取消其余尚未完成的页。
+        """
+        upload_path, file_type = doc.upload_path, doc.file_type
+        page_count = await asyncio.to_thread(_get_page_count, upload_path)
+        first_page = max(config.first_page or 1, 1)
+        last_page = min(config.last_page or page_count, page_count)
+
+        page_config = config.model_dump(exclude={"first_page", "last_page"})
+        cache_dir = doc.page_cache_dir / _get_config_hash(config)
+        await aiofiles.os.makedirs(cache_dir, exist_ok=True)
+        # 限制在途页数，避免大量页面排队占满进程池
+        semaphore = asyncio.Semaphore(settings.PROCESS_POOL_WORKERS)
+
+        async def extract_page(page: int) -> str:
+            cache_path = cache_dir / f"{page}.txt"
+            if await aiofiles.os.path.exists(cache_path):
+                async with aiofiles.open(cache_path, "r", encoding="utf-8") as file:
+                    return await file.read()
+
+            async with semaphore:
+                text = await run_in_process(
+                    partial(
+                        extract_text,
+                        upload_path,
+                        file_type=file_type,
+                        first_page=page,
+                        last_page=page,
+                        **page_config,
+                    ),
+                    timeout=settings.EXTRACT_TIMEOUT,
+                )
+            # 先写临时文件再重命名，避免并发读取到不完整的缓存
+            tmp_path = cache_path.with_suffix(".part")
+            async with aiofiles.open(tmp_path, "w", encoding="utf-8") as file:
+                await file.write(text)
+            await aiofiles.os.replace(tmp_path, cache_path)
+            return text
+
+        tasks = [
+            asyncio.ensure_future(extract_page(page))
+            for page in range(first_page, last_page + 1)
+        ]
+        try:
+            texts = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return "\n".join(texts)
+
+    async def normalize_doc(
+        self,
+        doc_id: int,
+        config: NormalizeConfig,
+        raw_text: str | None = None,
+    ) -> str | None:
+        """标准化文档内容，返回标准化后的文本
+
+        提取结果、配置和 kgtools 版本都与上次标准化相同时跳过标准化，
+        返回 None。
 
-    async def normalize_doc(self, doc_id: int, config: NormalizeConfig):
-        """标准化文档内容"""
+        Args:
+            raw_text: 已在内存中的提取文本，为空时从磁盘读取
+        """
         doc = await self.get_doc(doc_id)
         if not doc:
             raise ValueError(f"Document {doc_id} not found")
 
-        raw_text = await doc.read_text(DocState.EXTRACTED)
-        normalized_text = normalize_text(
-            raw_text,
-            **config.model_dump(),
+        fingerprint = _get_fingerprint(
+            doc.extract_fingerprint, config.model_dump(mode="json")
+        )
+        if (
+            doc.extract_fingerprint is not None
+            and doc.normalize_fingerprint == fingerprint
+            and doc.find_path(DocState.NORMALIZED).exists()
+        ):
+            return None
+
+        if raw_text is None:
+            raw_text = await doc.read_text(DocState.EXTRACTED)
+        normalized_text = await run_in_process(
+            partial(normalize_text, raw_text, **config.model_dump()),
+            timeout=settings.NORMALIZE_TIMEOUT,
         )
 
         async with transaction(self.db):
             await doc.write_text(normalized_text, DocState.NORMALIZED)
+            await self.db.execute(
+                update(Document)
+                .where(Document.local_file_name == doc.local_file_name)
+                .values(normalize_fingerprint=fingerprint)
+            )
+            # 标准化文本由内容相同的文档共享，它们的图谱贡献同样需要更新
+            await self.db.execute(
+                update(Document)
+                .where(
+                    Document.local_file_name == doc.local_file_name,
+                    Document.state == DocState.NORMALIZED,
+                )
+                .values(graph_synced=False)
+            )
+        return normalized_text
+
+    async def transition_docs(
+        self,
+        doc_filter: DocFilter,
+        from_states: Iterable[DocState],
+        state: DocState,
+    ) -> list[tuple[int, DocState]]:
+        """将符合条件的文档批量切换到新状态
+
+        每个原状态对应一条 UPDATE ... RETURNING 语句，在同一个事务中完成，
+        并返回各文档原来的状态，供任务失败时恢复。
+
+        Returns:
+            (文档 ID, 原状态) 列表
+        """
+        conditions: list[ColumnElement[bool]] = []
+        if doc_filter.ids is not None:
+            conditions.append(Document.id.in_(doc_filter.ids))
+        if doc_filter.state is not None:
+            conditions.append(Document.state == doc_filter.state)
+        if doc_filter.subject:
+            conditions.append(
+                Document.id.in_(
+                    select(document_keywords.c.document_id)
+                    .join(Keyword, Keyword.id == document_keywords.c.keyword_id)
+                    .where(Keyword.subject.in_(doc_filter.subject))
+                )
+            )
+
+        docs: list[tuple[int, DocState]] = []
+        async with transaction(self.db):
+            for from_state in from_states:
+                result = await self.db.execute(
+                    update(Document)
+                    .where(Document.state == from_state, *conditions)
+                    .values(state=state)
+                    .returning(Document.id)
+                )
+                docs.extend((doc_id, from_state) for doc_id in result.scalars())
+        return docs
+
+    async def update_docs_state(self, doc_ids: list[int], state: DocState):
+        """批量更新文档状态"""
+        async with transaction(self.db):
+            await self.db.execute(
+                update(Document).where(Document.id.in_(doc_ids)).values(state=state)
+            )
 
     async def update_doc_state(self, doc_id: int, state: DocState):
         """更新文档信息"""
@@ -97,28 +446,58 @@ class DocService:
         return items, total
 
     async def download_doc(self, doc_id: int, state: DocState):
-        """下载文档"""
+        """下载文档，返回实际存储的文件路径 (文本可能压缩存储) 和下载文件名"""
         doc = await self.get_doc(doc_id)
         if doc is None:
             raise ValueError(f"Document {doc_id} not found")
         if doc.state < state:
             raise ValueError(f"Document {doc_id} is not in {state} state")
 
-        path = doc.get_path(state)
+        path = doc.find_path(state)
         filename = (
-            doc.file_name if state == DocState.UPLOADED else f"{doc.title}.{state}.txt"
+            doc.file_name
+            if state == DocState.UPLOADED
+            else f"{doc.title}.{state.value}.txt"
         )
 
         return path, filename
 
     async def delete_doc(self, doc_id: int):
-        """删除文档"""
+        """删除文档
+
+        上传文件和文本文件由内容相同的文档共享，最后一个引用它们的文档
+        被删除时才删除文件。
+        """
         doc = await self.get_doc(doc_id)
         if doc is None:
             return False
 
-        doc.delete_dirs()
-
+        unshared_paths = await self._get_unshared_paths(doc)
         async with transaction(self.db):
+            await self.db.execute(
+                delete(document_keyword_counts).where(
+                    document_keyword_counts.c.document_id == doc_id
+                )
+            )
             await self.db.delete(doc)
+
+        _remove_paths(unshared_paths)
         return True
+
+    async def _get_unshared_paths(self, doc: Document) -> list[Path]:
+        """获取没有被其他文档引用的文件路径"""
+        result = await self.db.execute(
+            select(Document.file_type).where(
+                Document.local_file_name == doc.local_file_name,
+                Document.id != doc.id,
+            )
+        )
+        file_types = set(result.scalars().all())
+        if not file_types:
+            paths = [doc.upload_path, doc.page_cache_dir]
+            for state in (DocState.EXTRACTED, DocState.NORMALIZED):
+                paths.extend(compression.get_variants(doc.get_path(state)))
+            return paths
+        if doc.file_type not in file_types:
+            return [doc.upload_path]
+        return []
@@ -1,14 +1,128 @@
-from typing import Sequence
+import asyncio
+import logging
+import time
+from functools import partial
+from itertools import islice
+from typing import AsyncIterable
 
+import numpy as np
 from kgtools.graph import build_graph as build_relation_matrix
 from kgtools.schemas.graph import GraphConfig
-from sqlalchemy import delete
+from scipy.sparse import coo_matrix, csr_matrix
+from sqlalchemy import Select, delete, func, or_, tuple_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from ..core.bulk import bulk_insert, conflict_insert, iter_chunks
+from ..core.executor import run_in_process
+from ..core.matcher import KeywordMatcher
 from ..database import transaction
-from ..models import Edge, Keyword
+from ..models import (
+    DocRelation,
+    Document,
+    Edge,
+    GraphVersion,
+    Keyword,
+    document_keyword_counts,
+)
+from ..schemas.base import Result, ResultEnum
 from ..schemas.graph import EdgeBase, GraphBase, NodeBase, NodeData
+from ..schemas.subject import Subject
+from ..settings import settings
+
+logger = logging.getLogger(__name__)
+
+# 批量查询边时每批的关键词对数量，避免超出数据库参数上限
+PAIR_CHUNK_SIZE = 500
+
+EDGE_COLUMNS = ("version", "source", "target", "weight")
+DOC_RELATION_COLUMNS = ("document_id", "source", "target", "weight")
+KEYWORD_COUNT_COLUMNS = ("document_id", "keyword_id", "count")
+
+
+def _hit_relation_matrix(
+    text: str,
+    hits: list[int],
+    hit_names: list[str],
+    size: int,
+    graph_config: GraphConfig,
+) -> coo_matrix:
+    """计算文档中出现的关键词之间的关系，并映射回全体关键词的下标
+
+    只需要出现的关键词和词表大小，在子进程中执行时无需传输匹配器。
+
+    Args:
+        text: 文档的标准化文本
+        hits: 出现的关键词在全体关键词中的下标，升序排列
+        hit_names: 出现的关键词名称，与 hits 一一对应
+        size: 全体关键词数量
+        graph_config: 图谱配置
+    """
+    shape = (size, size)
+    if len(hits) < 2:
+        return coo_matrix(shape)
+
+    indices = np.asarray(hits)
+    matrix = coo_matrix(
+        build_relation_matrix([text], hit_names, **graph_config.model_dump())
+    )
+    matrix = coo_matrix(
+        (matrix.data, (indices[matrix.row], indices[matrix.col])), shape=shape
+    )
+    matrix.sum_duplicates()
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def _doc_relation_matrix(
+    text: str,
+    matcher: KeywordMatcher,
+    graph_config: GraphConfig,
+    hits: list[int] | None = None,
+) -> coo_matrix:
+    """计算单个文档对关系矩阵的贡献
+
+    只把文档中出现的关键词交给 kgtools 计算关系，再映射回全体关键词的下标。
+
+    Args:
+        text: 文档的标准化文本
+        matcher: 由全体关键词构建的匹配器
+        graph_config: 图谱配置
+        hits: 已知在文档中出现的关键词下标，为 None 时用匹配器扫描文本得到
+    """
+    if hits is None:
+        hits = list(matcher.count(text))
+    hits = sorted(hits)
+    hit_names = [matcher.names[index] for index in hits]
+    return _hit_relation_matrix(text, hits, hit_names, len(matcher), graph_config)
+
+
+def _compute_doc_relations(
+    matcher: KeywordMatcher,
+    graph_config: GraphConfig,
+    docs: list[tuple[int, str]],
+):
+    """在子进程中统计一批文档的关键词出现次数并计算关系矩阵
+
+    匹配器随每批文档传输一次。同时返回耗费的 CPU 时间。
+    """
+    start = time.process_time()
+    results = []
+    for doc_id, text in docs:
+        counts = matcher.count_ids(text)
+        hits = [matcher.index[keyword_id] for keyword_id in counts]
+        matrix = _doc_relation_matrix(text, matcher, graph_config, hits)
+        results.append((doc_id, counts, matrix))
+    return results, time.process_time() - start
+
+
+def _edge_records(matrix: coo_matrix, keyword_ids: np.ndarray):
+    """将稀疏矩阵的 COO 数组转换为 (source, target, weight) 记录"""
+    return zip(
+        keyword_ids[matrix.row].tolist(),
+        keyword_ids[matrix.col].tolist(),
+        matrix.data.tolist(),
+    )
 
 
 class GraphService:
@@ -16,40 +130,414 @@ class GraphService:
         self.db = db
 
     async def build_graph(
-        self, docs: list[str], keywords: Sequence[Keyword], graph_config: GraphConfig
+        self,
+        docs: AsyncIterable[tuple[int, str]],
+        matcher: KeywordMatcher,
+        graph_config: GraphConfig,
+    ):
+        """全量构建知识图谱并存入数据库
+
+        同时重新统计并覆盖所有文档的关键词出现次数。新的边写入一个未激活的版本，
+        写入完成后在一个极小的事务中切换激活版本，读取方始终只看到完整的图谱。
+        旧版本由 gc_versions 回收。
+
+        Args:
+            docs: 逐个产出 (文档 ID, 标准化文本) 的异步迭代器，文本计算完即释放，
+                内存中只保留稀疏矩阵
+            matcher: 由全体关键词构建的匹配器
+            graph_config: 图谱配置
+
+        Returns:
+            新的图谱版本 ID
+        """
+        keyword_ids = np.asarray(matcher.ids, dtype=np.int64)
+
+        relation_matrix = csr_matrix((len(keyword_ids), len(keyword_ids)))
+        doc_matrices = []
+        keyword_counts = []
+        cpu_time = 0.0
+
+        def collect(tasks):
+            nonlocal relation_matrix, cpu_time
+            for task in tasks:
+                results, elapsed = task.result()
+                for doc_id, counts, matrix in results:
+                    relation_matrix += matrix
+                    doc_matrices.append((doc_id, matrix))
+                    keyword_counts.append((doc_id, counts))
+                cpu_time += elapsed
+
+        def submit(batch):
+            compute = partial(_compute_doc_relations, matcher, graph_config, batch)
+            pending.add(asyncio.ensure_future(run_in_process(compute)))
+
+        # 文档按批分发到共享进程池，限制在途任务数以保持内存有界
+        max_pending = 2 * settings.PROCESS_POOL_WORKERS
+        start = time.perf_counter()
+        pending: set[asyncio.Future] = set()
+        batch: list[tuple[int, str]] = []
+        try:
+            async for doc_id, text in docs:
+                batch.append((doc_id, text))
+                if len(batch) < settings.GRAPH_BATCH_SIZE:
+                    continue
+                submit(batch)
+                batch = []
+                if len(pending) >= max_pending:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    collect(done)
+            if batch:
+                submit(batch)
+            if pending:
+                done, pending = await asyncio.wait(pending)
+                collect(done)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        wall_time = time.perf_counter() - start
+        logger.info(
+            f"counted {len(doc_matrices)} docs "
+            f"with {settings.PROCESS_POOL_WORKERS} workers in {wall_time:.2f}s, "
+            f"speedup {cpu_time / max(wall_time, 1e-9):.2f}x"
+        )
+
+        relation_matrix = relation_matrix.tocoo()
+        relation_matrix.eliminate_zeros()
+
+        version_id = await self._create_version()
+        try:
+            async with transaction(self.db):
+                await self.db.execute(delete(DocRelation))
+                await bulk_insert(
+                    self.db,
+                    Edge.__table__,
+                    EDGE_COLUMNS,
+                    (
+                        (version_id, *record)
+                        for record in _edge_records(relation_matrix, keyword_ids)
+                    ),
+                )
+                await bulk_insert(
+                    self.db,
+                    DocRelation.__table__,
+                    DOC_RELATION_COLUMNS,
+                    (
+                        (doc_id, *record)
+                        for doc_id, matrix in doc_matrices
+                        for record in _edge_records(matrix, keyword_ids)
+                    ),
+                )
+                await self.db.execute(delete(document_keyword_counts))
+                await bulk_insert(
+                    self.db,
+                    document_keyword_counts,
+                    KEYWORD_COUNT_COLUMNS,
+                    (
+                        (doc_id, keyword_id, count)
+                        for doc_id, counts in keyword_counts
+                        for keyword_id, count in counts.items()
+                    ),
+                )
+                size = settings.KEYWORD_IMPORT_CHUNK_SIZE
+                for keyword_chunk in iter_chunks(matcher.ids, size):
+                    await self.db.execute(
+                        update(Keyword)
+                        .where(Keyword.id.in_(keyword_chunk))
+                        .values(indexed=True)
+                    )
+                doc_ids = (doc_id for doc_id, _ in doc_matrices)
+                for doc_chunk in iter_chunks(doc_ids, size):
+                    await self.db.execute(
+                        update(Document)
+                        .where(Document.id.in_(doc_chunk))
+                        .values(graph_synced=True)
+                    )
+        except Exception:
+            await self._delete_version(version_id)
+            raise
+
+        await self._activate_version(version_id)
+        return version_id
+
+    async def update_doc_graph(
+        self,
+        doc_id: int,
+        text: str | None,
+        matcher: KeywordMatcher,
+        graph_config: GraphConfig,
+        hits: list[int] | None = None,
+    ):
+        """增量更新单个文档对知识图谱的贡献
+
+        只重新计算该文档的关系矩阵，并把新旧贡献之差应用到受影响的边上。
+
+        Args:
+            doc_id: 文档 ID
+            text: 文档的标准化文本，为 None 时移除该文档的贡献
+            matcher: 由全体关键词构建的匹配器
+            graph_config: 图谱配置
+            hits: 已知在文档中出现的关键词下标，为 None 时扫描文本得到
+        """
+        new_relations: dict[tuple[int, int], float] = {}
+        if text is not None:
+            keyword_ids = np.asarray(matcher.ids, dtype=np.int64)
+            if hits is None:
+                hits = list(await asyncio.to_thread(matcher.count, text))
+            hits = sorted(hits)
+            if len(hits) < 2:
+                # 不会产生关系，无需提交到进程池
+                matrix = coo_matrix((len(matcher), len(matcher)))
+            else:
+                # 只把出现的关键词传给进程池，无需序列化整个匹配器
+                hit_names = [matcher.names[index] for index in hits]
+                matrix = await run_in_process(
+                    partial(
+                        _hit_relation_matrix,
+                        text,
+                        hits,
+                        hit_names,
+                        len(matcher),
+                        graph_config,
+                    )
+                )
+            new_relations = {
+                (source, target): weight
+                for source, target, weight in _edge_records(matrix, keyword_ids)
+            }
+
+        result = await self.db.execute(
+            select(DocRelation.source, DocRelation.target, DocRelation.weight).where(
+                DocRelation.document_id == doc_id
+            )
+        )
+        old_relations = {(source, target): w for source, target, w in result.all()}
+
+        deltas = {
+            pair: new_relations.get(pair, 0.0) - old_relations.get(pair, 0.0)
+            for pair in new_relations.keys() | old_relations.keys()
+        }
+        deltas = {pair: delta for pair, delta in deltas.items() if delta}
+
+        version_id = await self._get_or_create_active_version_id()
+        async with transaction(self.db):
+            await self.db.execute(
+                delete(DocRelation).where(DocRelation.document_id == doc_id)
+            )
+            await bulk_insert(
+                self.db,
+                DocRelation.__table__,
+                DOC_RELATION_COLUMNS,
+                ((doc_id, *pair, w) for pair, w in new_relations.items()),
+            )
+            await self._apply_edge_deltas(version_id, deltas)
+            await self.db.execute(
+                update(GraphVersion)
+                .where(GraphVersion.id == version_id)
+                .values(revision=GraphVersion.revision + 1)
+            )
+            if text is not None:
+                await self.db.execute(
+                    update(Document)
+                    .where(Document.id == doc_id)
+                    .values(graph_synced=True)
+                )
+
+    async def _apply_edge_deltas(
+        self, version_id: int, deltas: dict[tuple[int, int], float]
     ):
-        """构建知识图谱并存入数据库"""
-        keyword_names = [keyword.name for keyword in keywords]
+        """将权重增量应用到指定版本的边上，权重归零的边被删除
+
+        增量在一条 INSERT ... ON CONFLICT DO UPDATE 语句中累加到已有的边上，
+        并发的增量更新不会丢失，也不会插入重复的边。
+        """
+        stmt = await conflict_insert(self.db, Edge.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["version", "source", "target"],
+            set_={"weight": func.coalesce(Edge.weight, 0.0) + stmt.excluded.weight},
+        )
+        pairs = iter(deltas)
+        while chunk := list(islice(pairs, PAIR_CHUNK_SIZE)):
+            await self.db.execute(
+                stmt,
+                [
+                    {
+                        "version": version_id,
+                        "source": source,
+                        "target": target,
+                        "weight": deltas[source, target],
+                    }
+                    for source, target in chunk
+                ],
+            )
+            await self.db.execute(
+                delete(Edge).where(
+                    Edge.version == version_id,
+                    tuple_(Edge.source, Edge.target).in_(chunk),
+                    func.abs(Edge.weight) < 1e-9,
+                )
+            )
 
-        relation_matrix = build_relation_matrix(
-            docs, keyword_names, **graph_config.model_dump()
+    async def get_graph_doc_ids(self) -> set[int]:
+        """获取已计入图谱的文档 ID"""
+        result = await self.db.execute(select(DocRelation.document_id).distinct())
+        return set(result.scalars().all())
+
+    async def get_active_version(self) -> GraphVersion | None:
+        """获取当前激活的图谱版本"""
+        result = await self.db.execute(
+            select(GraphVersion).where(GraphVersion.is_active)
+        )
+        return result.scalar_one_or_none()
+
+    async def gc_versions(self) -> int:
+        """回收比激活版本更旧的图谱版本，返回回收的版本数量"""
+        active_version = await self.get_active_version()
+        if active_version is None:
+            return 0
+
+        result = await self.db.execute(
+            select(GraphVersion.id).where(GraphVersion.id < active_version.id)
         )
+        version_ids = result.scalars().all()
+        for version_id in version_ids:
+            await self._delete_version(version_id)
+        return len(version_ids)
+
+    async def _create_version(self) -> int:
+        """创建一个未激活的图谱版本"""
+        async with transaction(self.db):
+            version = GraphVersion()
+            self.db.add(version)
+            await self.db.flush()
+            version_id = version.id
+        return version_id
 
-        rows, cols = relation_matrix.nonzero()
-        edges = [
-            Edge(
-                source=keywords[i].id,
-                target=keywords[j].id,
-                weight=relation_matrix[i, j],
+    async def _activate_version(self, version_id: int):
+        """在单条语句中切换激活版本"""
+        async with transaction(self.db):
+            await self.db.execute(
+                update(GraphVersion).values(is_active=GraphVersion.id == version_id)
             )
-            for i, j in zip(rows, cols)
-        ]
 
+    async def _get_or_create_active_version_id(self) -> int:
+        """获取激活版本 ID，不存在时创建一个空版本"""
+        active_version = await self.get_active_version()
+        if active_version is not None:
+            return active_version.id
+
+        version_id = await self._create_version()
+        await self._activate_version(version_id)
+        return version_id
+
+    async def _delete_version(self, version_id: int):
+        """删除图谱版本及其所有边"""
         async with transaction(self.db):
-            await self.db.execute(delete(Edge))  # 清除旧的图数据
-            for edge in edges:
-                self.db.add(edge)
+            await self.db.execute(delete(Edge).where(Edge.version == version_id))
+            await self.db.execute(
+                delete(GraphVersion).where(GraphVersion.id == version_id)
+            )
 
     async def get_graph(self):
-        """从数据库中提取知识图谱"""
-        result = await self.db.execute(select(Edge))
+        """从数据库中提取当前激活版本的知识图谱"""
+        active_version = await self.get_active_version()
+        if active_version is None:
+            return None
+        return await self._load_graph(
+            select(Edge).where(Edge.version == active_version.id)
+        )
+
+    async def get_subgraph(
+        self,
+        subject: list[Subject] | None = None,
+        keyword_id: int | None = None,
+        hops: int = 1,
+        top: int | None = None,
+        min_weight: float | None = None,
+    ):
+        """按条件提取当前激活版本的子图
+
+        Args:
+            subject: 只保留两端关键词都属于这些学科的边
+            keyword_id: 只保留该关键词 hops 跳以内的邻域
+            hops: 邻域跳数
+            top: 只保留权重最大的前 top 条边
+            min_weight: 只保留权重不小于该值的边
+        """
+        active_version = await self.get_active_version()
+        if active_version is None:
+            return None
+
+        query = select(Edge).where(Edge.version == active_version.id)
+        if min_weight is not None:
+            query = query.where(Edge.weight >= min_weight)
+        if subject:
+            subject_ids = select(Keyword.id).where(Keyword.subject.in_(subject))
+            query = query.where(
+                Edge.source.in_(subject_ids), Edge.target.in_(subject_ids)
+            )
+        if keyword_id is not None:
+            node_ids = await self._get_neighborhood(query, keyword_id, hops)
+            query = query.where(Edge.source.in_(node_ids), Edge.target.in_(node_ids))
+        if top is not None:
+            query = query.order_by(Edge.weight.desc()).limit(top)
+
+        return await self._load_graph(query)
+
+    async def _get_neighborhood(
+        self, query: Select, keyword_id: int, hops: int
+    ) -> set[int]:
+        """逐跳扩展，获取满足边筛选条件的关键词邻域"""
+        node_ids = {keyword_id}
+        frontier = {keyword_id}
+        for _ in range(hops):
+            result = await self.db.execute(
+                query.with_only_columns(Edge.source, Edge.target).where(
+                    or_(Edge.source.in_(frontier), Edge.target.in_(frontier))
+                )
+            )
+            frontier = {node for edge in result.all() for node in edge} - node_ids
+            if not frontier:
+                break
+            node_ids |= frontier
+        return node_ids
+
+    async def get_graph_payload(self) -> tuple[str, bytes] | None:
+        """将当前激活版本的图谱序列化为完整的响应体
+
+        Returns:
+            图谱内容标识和 JSON 响应体，图谱不存在时返回 None
+        """
+        active_version = await self.get_active_version()
+        if active_version is None:
+            return None
+
+        tag = active_version.tag
+        graph = await self._load_graph(
+            select(Edge).where(Edge.version == active_version.id)
+        )
+        if graph is None:
+            return None
+
+        payload = Result(code=ResultEnum.SUCCESS, result=graph).model_dump_json()
+        return tag, payload.encode()
+
+    async def _load_graph(self, query: Select):
+        """读取查询到的边及其两端的关键词"""
+        result = await self.db.execute(query)
         edges = result.scalars().all()
         if not edges:
             return None
 
         node_ids = {edge.source for edge in edges} | {edge.target for edge in edges}
-        result = await self.db.execute(select(Keyword).where(Keyword.id.in_(node_ids)))
-        nodes = result.scalars().all()
+        result = await self.db.execute(
+            select(Keyword.id, Keyword.name, Keyword.subject).where(
+                Keyword.id.in_(node_ids)
+            )
+        )
+        nodes = result.all()
         if not nodes:
             return None
 
@@ -1,47 +1,166 @@
-from sqlalchemy import func, insert, select
+from typing import AsyncIterable, Iterable
+
+from sqlalchemy import delete, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..core.bulk import conflict_insert
+from ..core.matcher import KeywordMatcher
 from ..database import transaction
-from ..models.keyword import Keyword
-from ..schemas.keyword import KeywordCreate, KeywordItem
+from ..models.document import Document
+from ..models.keyword import Keyword, document_keyword_counts
+from ..schemas.keyword import KeywordCreate, KeywordImportResult, KeywordItem
 from ..schemas.subject import Subject
+from ..settings import settings
+
+# 进程内缓存的匹配器及其对应的关键词表签名
+_matcher_cache: tuple[tuple, KeywordMatcher] | None = None
+
+
+def invalidate_keyword_matcher():
+    """使缓存的关键词匹配器失效"""
+    global _matcher_cache
+    _matcher_cache = None
 
 
 class KeywordService:
     def __init__(self, db: AsyncSession):
         self.db = db
 
-    async def create_keyword(self, keyword_create: KeywordCreate):
-        """创建关键词"""
-        if await self.get_keyword_by_name(keyword_create.name):
+    async def create_keyword(self, keyword_create: KeywordCreate) -> int:
+        """创建关键词，返回关键词ID
+
+        直接插入并由名称唯一约束判断是否已存在，无需先查询，并发创建同名
+        关键词时只有一个成功。
+        """
+        stmt = await self._get_insert_stmt()
+        async with transaction(self.db):
+            result = await self.db.execute(stmt.values(keyword_create.model_dump()))
+            keyword_id = result.scalar_one_or_none()
+        if keyword_id is None:
             raise ValueError(
                 f"Keyword '{keyword_create.name}' has already been created"
             )
+        invalidate_keyword_matcher()
+        return keyword_id
 
-        async with transaction(self.db):
-            db_keyword = Keyword(**keyword_create.model_dump())
-            self.db.add(db_keyword)
+    async def create_keywords(self, keywords: list[KeywordCreate]) -> int:
+        """批量创建关键词，返回新增的数量
 
-    async def create_keywords(self, keywords: list[KeywordCreate]):
-        """批量创建关键词"""
-        unique_keywords = {kw.name: kw for kw in keywords}
-        if not unique_keywords:
+        每块一条 INSERT ... ON CONFLICT DO NOTHING 语句，所有块在同一事务中
+        提交，已存在或被并发写入的关键词直接跳过。
+        """
+        values = list({kw.name: kw.model_dump() for kw in keywords}.values())
+        if not values:
             raise ValueError("No keywords provided")
 
-        stmt = select(Keyword.name).where(Keyword.name.in_(unique_keywords))
-        result = await self.db.execute(stmt)
-        existing_names = {row[0] for row in result.fetchall()}
-
-        new_keywords = [
-            kw for kw in unique_keywords.values() if kw.name not in existing_names
-        ]
+        stmt = await self._get_insert_stmt()
+        size = settings.KEYWORD_IMPORT_CHUNK_SIZE
+        inserted = 0
+        async with transaction(self.db):
+            for start in range(0, len(values), size):
+                result = await self.db.execute(stmt, values[start : start + size])
+                inserted += len(result.all())
 
-        if not new_keywords:
+        if not inserted:
             raise ValueError("All keywords already exist")
-
-        async with transaction(self.db):
-            values = [keyword.model_dump() for keyword in new_keywords]
-            await self.db.execute(insert(Keyword).values(values))
+        invalidate_keyword_matcher()
+        return inserted
+
+    async def import_keywords(
+        self, chunks: AsyncIterable[tuple[list[dict], int, int]]
+    ) -> KeywordImportResult:
+        """按块导入关键词
+
+        每块在一条 INSERT ... ON CONFLICT DO NOTHING 语句中写入并单独提交，
+        已存在的关键词计为跳过。重复导入同一文件是幂等的。
+
+        Args:
+            chunks: (关键词字段列表, 无效行数, 文件内重复行数)，关键词已校验
+                并去重
+        """
+        result = KeywordImportResult(inserted=0, skipped=0, invalid=0)
+        stmt = await self._get_insert_stmt()
+        async for values, invalid, duplicates in chunks:
+            result.invalid += invalid
+            result.skipped += duplicates
+            if not values:
+                continue
+            async with transaction(self.db):
+                rows = await self.db.execute(stmt, values)
+                inserted = len(rows.all())
+            result.inserted += inserted
+            result.skipped += len(values) - inserted
+        if result.inserted:
+            invalidate_keyword_matcher()
+        return result
+
+    async def get_or_create_keywords(
+        self, names: Iterable[str], subject: Subject
+    ) -> tuple[dict[str, int], int]:
+        """获取关键词名称到ID的映射，不存在的关键词以指定学科创建
+
+        已存在的关键词按块用 IN 查询取出，缺失的在一条 INSERT ... ON
+        CONFLICT DO NOTHING 语句中创建。不提交事务，由调用方统一提交。
+
+        Returns:
+            (名称到ID的映射, 新增的关键词数量)，新增关键词需要调用方提交后
+            触发 index_keywords 统计出现次数
+        """
+        names = list(dict.fromkeys(names))
+        size = settings.KEYWORD_IMPORT_CHUNK_SIZE
+        keyword_ids = await self._get_keyword_ids(names)
+        missing = [name for name in names if name not in keyword_ids]
+        if not missing:
+            return keyword_ids, 0
+
+        inserted = 0
+        stmt = await self._get_insert_stmt()
+        for start in range(0, len(missing), size):
+            values = [
+                {"name": name, "subject": subject}
+                for name in missing[start : start + size]
+            ]
+            result = await self.db.execute(stmt, values)
+            rows = result.all()
+            inserted += len(rows)
+            keyword_ids.update((name, keyword_id) for keyword_id, name in rows)
+        invalidate_keyword_matcher()
+
+        # 插入前被并发创建的关键词不会返回，再查询一次
+        keyword_ids.update(
+            await self._get_keyword_ids(
+                [name for name in missing if name not in keyword_ids]
+            )
+        )
+        return keyword_ids, inserted
+
+    async def _get_keyword_ids(self, names: list[str]) -> dict[str, int]:
+        """按块查询关键词名称到ID的映射，避免超出数据库参数数量上限"""
+        keyword_ids: dict[str, int] = {}
+        size = settings.KEYWORD_IMPORT_CHUNK_SIZE
+        for start in range(0, len(names), size):
+            result = await self.db.execute(
+                select(Keyword.name, Keyword.id).where(
+                    Keyword.name.in_(names[start : start + size])
+                )
+            )
+            keyword_ids.update(result.all())
+        return keyword_ids
+
+    async def _get_insert_stmt(self):
+        """获取跳过同名关键词并返回新增关键词ID的插入语句
+
+        按当前数据库方言生成 INSERT ... ON CONFLICT (name) DO NOTHING
+        RETURNING id, name，批量执行时每块只发送一条语句。
+        """
+        stmt = await conflict_insert(self.db, Keyword.__table__)
+        return (
+            stmt.on_conflict_do_nothing(index_elements=["name"])
+            .returning(Keyword.id, Keyword.name)
+            .execution_options(
+                insertmanyvalues_page_size=settings.KEYWORD_IMPORT_CHUNK_SIZE
+            )
+        )
 
     async def get_keyword(self, keyword_id: int):
         """获取单个关键词"""
@@ -58,6 +177,25 @@ class KeywordService:
         result = await self.db.execute(select(Keyword))
         return result.scalars().all()
 
+    async def get_matcher(self) -> KeywordMatcher:
+        """获取由关键词表构建的匹配器
+
+        匹配器在进程内缓存。本进程内的增删会直接使缓存失效，其他进程的修改
+        通过比对关键词表签名 (数量、最大与总和 ID) 发现。
+        """
+        global _matcher_cache
+        result = await self.db.execute(
+            select(func.count(Keyword.id), func.max(Keyword.id), func.sum(Keyword.id))
+        )
+        signature = tuple(result.one())
+        if _matcher_cache is None or _matcher_cache[0] != signature:
+            keywords = await self.db.execute(
+                select(Keyword.id, Keyword.name).order_by(Keyword.id)
+            )
+            matcher = KeywordMatcher(dict(keywords.all()))
+            _matcher_cache = (signature, matcher)
+        return _matcher_cache[1]
+
     async def get_keyword_list(
         self, skip: int = 0, limit: int = 10, subject: list[Subject] | None = None
     ):
@@ -80,12 +218,38 @@ class KeywordService:
 
         return items, total
 
+    async def get_unindexed_keywords(self) -> dict[int, str]:
+        """获取尚未统计出现次数的关键词"""
+        result = await self.db.execute(
+            select(Keyword.id, Keyword.name).where(Keyword.indexed.is_(False))
+        )
+        return dict(result.all())
+
     async def delete_keyword(self, keyword_id: int) -> bool:
-        """删除关键词"""
+        """删除关键词
+
+        出现过该关键词的文档会被标记为需要重新计入图谱。
+        """
         db_keyword = await self.get_keyword(keyword_id)
         if db_keyword is None:
             return False
 
+        counts = document_keyword_counts.c
         async with transaction(self.db):
+            await self.db.execute(
+                update(Document)
+                .where(
+                    Document.id.in_(
+                        select(counts.document_id).where(
+                            counts.keyword_id == keyword_id
+                        )
+                    )
+                )
+                .values(graph_synced=False)
+            )
+            await self.db.execute(
+                delete(document_keyword_counts).where(counts.keyword_id == keyword_id)
+            )
             await self.db.delete(db_keyword)
+        invalidate_keyword_matcher()
         return True
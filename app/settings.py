@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -31,6 +32,38 @@ class Settings(BaseSettings):
         """标准化文本目录"""
         return Path(f"{self.STORAGE_DIR}/texts/normalized")
 
+    @property
+    def PAGE_CACHE_DIR(self):
+        """PDF 逐页提取结果缓存目录"""
+        return Path(f"{self.STORAGE_DIR}/cache/pages")
+
+    # 提取与标准化文本的压缩格式 (none, zstd, gzip) 及压缩级别，
+    # 未安装 zstandard 时 zstd 退回 gzip
+    TEXT_COMPRESSION: Literal["none", "zstd", "gzip"] = "none"
+    TEXT_COMPRESSION_LEVEL: int = 3
+
+    # 上传文件分块写入的块大小 (字节)
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+
+    # 关键词导入时每条 INSERT 语句写入的行数，需低于数据库的参数数量上限
+    KEYWORD_IMPORT_CHUNK_SIZE: int = 5000
+
+    # 图谱全量构建时每个进程池任务计算的文档数
+    GRAPH_BATCH_SIZE: int = 16
+
+    # 图谱更新后延迟多少秒再序列化缓存，期间的多次更新合并为一次
+    GRAPH_CACHE_DELAY: float = 5
+
+    # 文本提取、标准化及图谱计算共享的进程池大小，以及超时时间 (秒)
+    PROCESS_POOL_WORKERS: int = 4
+    EXTRACT_TIMEOUT: float = 3600
+    NORMALIZE_TIMEOUT: float = 600
+
+    # 批量任务速率限制 (每秒任务数)，已登录用户按用户限速，匿名提交按批次限速。
+    # 默认 0 表示不限速：批量队列已与交互队列隔离，多个提交者需要公平分享
+    # 批量 worker 时再开启
+    BULK_JOBS_PER_SECOND: float = 0
+
     # Redis 配置
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
@@ -49,6 +82,19 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str = "HS256"
     JWT_ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # 用户身份缓存的过期时间 (秒) 和进程内缓存容量，以及是否同时缓存到 Redis
+    AUTH_CACHE_TTL: float = 60
+    AUTH_CACHE_SIZE: int = 1024
+    AUTH_CACHE_REDIS: bool = True
+
+    # 密码哈希线程数及同时进行的哈希计算数
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_CONCURRENCY: int = 4
+
+    # 每个客户端在时间窗口 (秒) 内允许的登录与注册次数
+    LOGIN_RATE_LIMIT: int = 10
+    LOGIN_RATE_WINDOW: int = 60
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -0,0 +1,106 @@
+"""对比逐个 ORM 写入与批量写入边的吞吐量
+
+用法：python -m scripts.bench_edges --keywords 2000 --density 0.05
+"""
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from scipy.sparse import random as sparse_random
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+# 添加项目根目录到 Python 路径
+sys.path.append(str(Path(__file__).parent.parent))
+from app.core.bulk import bulk_insert
+from app.database import Base
+from app.models import Edge, GraphVersion
+
+
+async def create_version(session: AsyncSession) -> int:
+    """创建边所属的图谱版本"""
+    async with session.begin():
+        version = GraphVersion()
+        session.add(version)
+        await session.flush()
+        return version.id
+
+
+async def write_orm(
+    session: AsyncSession, version_id: int, matrix, keyword_ids: np.ndarray
+):
+    """原实现：每条边一个 ORM 对象"""
+    rows, cols = matrix.nonzero()
+    edges = [
+        Edge(
+            version=version_id,
+            source=int(keyword_ids[i]),
+            target=int(keyword_ids[j]),
+            weight=float(matrix.data[k]),
+        )
+        for k, (i, j) in enumerate(zip(rows, cols))
+    ]
+    async with session.begin():
+        await session.execute(delete(Edge))
+        for edge in edges:
+            session.add(edge)
+
+
+async def write_bulk(
+    session: AsyncSession, version_id: int, matrix, keyword_ids: np.ndarray
+):
+    """批量写入：直接从 COO 数组流式插入"""
+    async with session.begin():
+        await session.execute(delete(Edge))
+        await bulk_insert(
+            session,
+            Edge.__table__,
+            ("version", "source", "target", "weight"),
+            zip(
+                [version_id] * matrix.nnz,
+                keyword_ids[matrix.row].tolist(),
+                keyword_ids[matrix.col].tolist(),
+                matrix.data.tolist(),
+            ),
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="边写入基准测试")
+    parser.add_argument("--keywords", type=int, default=2000, help="关键词数量")
+    parser.add_argument("--density", type=float, default=0.05, help="关系矩阵密度")
+    parser.add_argument("--database-url", help="数据库地址，默认使用临时 SQLite")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        url = args.database_url or f"sqlite+aiosqlite:///{tmp_dir}/bench.db"
+        engine = create_async_engine(url)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, class_=AsyncSession)
+
+        matrix = sparse_random(
+            args.keywords, args.keywords, density=args.density, format="coo"
+        )
+        keyword_ids = np.arange(1, args.keywords + 1)
+        print(f"边数量: {matrix.nnz}")
+        async with session_factory() as session:
+            version_id = await create_version(session)
+
+        for name, write in [("ORM", write_orm), ("bulk", write_bulk)]:
+            async with session_factory() as session:
+                start = time.perf_counter()
+                await write(session, version_id, matrix, keyword_ids)
+                elapsed = time.perf_counter() - start
+            print(f"{name:>5}: {elapsed:.2f}s, {matrix.nnz / elapsed:,.0f} edges/s")
+
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
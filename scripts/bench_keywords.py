@@ -0,0 +1,105 @@
+"""对比逐行校验与分块向量化导入关键词文件的吞吐量
+
+用法：python -m scripts.bench_keywords --rows 500000 --duplicates 0.1
+"""
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from io import BytesIO, StringIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from fastapi import UploadFile
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+# 添加项目根目录到 Python 路径
+sys.path.append(str(Path(__file__).parent.parent))
+from app.database import Base, transaction
+from app.dependencies.keyword import get_keywords
+from app.models import Keyword
+from app.schemas.keyword import KeywordCreate
+from app.schemas.subject import Subject
+from app.services import KeywordService
+
+
+def make_csv(rows: int, duplicates: float) -> bytes:
+    """生成关键词文件，按比例混入重复名称"""
+    rng = np.random.default_rng(0)
+    unique = max(1, int(rows * (1 - duplicates)))
+    names = np.char.add("关键词", rng.integers(0, unique, rows).astype(str))
+    subjects = rng.choice([subject.value for subject in Subject], rows)
+    return (
+        pd.DataFrame({0: names, 1: subjects}).to_csv(header=False, index=False).encode()
+    )
+
+
+async def import_rows(session: AsyncSession, content: bytes) -> int:
+    """原实现：iterrows 逐行构建 KeywordCreate，一条语句插入全部新关键词"""
+    df = pd.read_csv(StringIO(content.decode()), header=None)
+    keywords = [KeywordCreate(name=row[0], subject=row[1]) for _, row in df.iterrows()]
+    unique_keywords = {kw.name: kw for kw in keywords}
+    result = await session.execute(
+        select(Keyword.name).where(Keyword.name.in_(list(unique_keywords)))
+    )
+    existing_names = {row[0] for row in result.fetchall()}
+    values = [
+        kw.model_dump()
+        for kw in unique_keywords.values()
+        if kw.name not in existing_names
+    ]
+    async with transaction(session):
+        await session.execute(insert(Keyword).values(values))
+    return len(values)
+
+
+async def import_chunks(session: AsyncSession, content: bytes) -> int:
+    """分块向量化导入"""
+    file = UploadFile(BytesIO(content), filename="keywords.csv")
+    result = await KeywordService(session).import_keywords(await get_keywords(file))
+    return result.inserted
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="关键词导入基准测试")
+    parser.add_argument("--rows", type=int, default=500000, help="文件行数")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="重复比例")
+    parser.add_argument("--database-url", help="数据库地址，默认使用临时 SQLite")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        url = args.database_url or f"sqlite+aiosqlite:///{tmp_dir}/bench.db"
+        engine = create_async_engine(url)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, class_=AsyncSession)
+
+        content = make_csv(args.rows, args.duplicates)
+        print(f"行数: {args.rows}, 文件大小: {len(content) / 2**20:.1f} MiB")
+
+        for name, run in [("rows", import_rows), ("chunks", import_chunks)]:
+            async with session_factory() as session:
+                start = time.perf_counter()
+                try:
+                    inserted = await run(session, content)
+                except Exception as e:
+                    print(f"{name:>6}: failed, {e.__class__.__name__}: {e}"[:200])
+                    continue
+                finally:
+                    elapsed = time.perf_counter() - start
+                    async with session_factory() as cleanup, cleanup.begin():
+                        await cleanup.execute(delete(Keyword))
+            print(
+                f"{name:>6}: {elapsed:.2f}s, {args.rows / elapsed:,.0f} rows/s, "
+                f"inserted {inserted}"
+            )
+
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
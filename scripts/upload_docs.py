@@ -69,17 +69,11 @@ async def process_file(
     force_ocr: bool = False,
 ) -> bool:
     """上传并处理单个文件"""
-    # 提取文本
+    # 提取并清洗文本
     extract_config = {"num_workers": num_workers, "force_ocr": force_ocr}
-    async with session.put(f"{API_URL}/{doc_id}/extract", json=extract_config) as resp:
+    async with session.put(f"{API_URL}/{doc_id}/process", json=extract_config) as resp:
         if resp.status != 200:
-            print(f"✗ 提取文本失败: {doc_id}")
-            return False
-
-    # 清洗文本
-    async with session.put(f"{API_URL}/{doc_id}/normalize") as resp:
-        if resp.status != 200:
-            print(f"✗ 清洗文本失败: {doc_id}")
+            print(f"✗ 处理文本失败: {doc_id}")
             return False
 
     return True
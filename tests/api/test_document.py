@@ -72,6 +72,27 @@ async def test_normalize_doc_text_api(client: AsyncClient, sample_doc: int):
     assert data["state"] == DocState.NORMALIZED
 
 
+@pytest.mark.asyncio
+async def test_get_doc_file_api(client: AsyncClient, sample_doc: int):
+    """测试原始文件的 Range 请求和条件请求"""
+    response = await client.get(f"/documents/{sample_doc}/file")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    etag = response.headers["etag"]
+
+    response = await client.get(
+        f"/documents/{sample_doc}/file", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    response = await client.get(
+        f"/documents/{sample_doc}/download",
+        headers={"Range": "bytes=0-3", "If-Range": etag},
+    )
+    assert response.status_code == 206
+    assert response.content == b"%PDF"
+
+
 @pytest.mark.asyncio
 async def test_read_doc_api(client: AsyncClient, sample_doc: int):
     """测试获取单个文档API"""
@@ -0,0 +1,104 @@
+import pytest
+from httpx import AsyncClient
+from kgtools.schemas.graph import GraphConfig
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.graph_cache import GRAPH_PAYLOAD_KEY, GRAPH_TAG_KEY
+from app.core.matcher import KeywordMatcher
+from app.dependencies.redis import get_redis
+from app.main import app
+from app.models import DocRelation, Edge, GraphVersion, Keyword
+from app.schemas.subject import Subject
+from app.services import GraphService
+
+MATCHER = KeywordMatcher({1: "机器学习", 2: "统计", 3: "金融"})
+
+
+class FakeRedis:
+    """只实现图谱缓存用到的命令"""
+
+    def __init__(self):
+        self.data: dict[str, bytes] = {}
+        self.jobs: list[str] = []
+
+    async def get(self, key: str) -> bytes | None:
+        return self.data.get(key)
+
+    async def set(
+        self, key: str, value: str | bytes | int, ex: int | None = None, nx=False
+    ) -> bool:
+        if nx and key in self.data:
+            return False
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    async def enqueue_job(self, function: str, *args, **kwargs):
+        self.jobs.append(function)
+
+
+@pytest.fixture
+def redis():
+    fake_redis = FakeRedis()
+    app.dependency_overrides[get_redis] = lambda: fake_redis
+    yield fake_redis
+    app.dependency_overrides.pop(get_redis, None)
+
+
+@pytest.fixture
+async def graph_tag(db: AsyncSession):
+    """构建测试图谱，返回其内容标识"""
+    db.add_all(
+        Keyword(id=keyword_id, name=name, subject=Subject.DATA_SCIENCE)
+        for keyword_id, name in zip(MATCHER.ids, MATCHER.names)
+    )
+    await db.commit()
+
+    async def docs():
+        yield 1, "机器学习依赖统计方法，统计在金融中的应用。"
+
+    graph_svc = GraphService(db)
+    await graph_svc.build_graph(docs(), MATCHER, GraphConfig())
+    active_version = await graph_svc.get_active_version()
+    assert active_version is not None
+    yield active_version.tag
+
+    await db.execute(delete(Edge))
+    await db.execute(delete(DocRelation))
+    await db.execute(delete(GraphVersion))
+    await db.execute(delete(Keyword).where(Keyword.id.in_(MATCHER.ids)))
+    await db.commit()
+
+
+async def test_get_graph_cache_miss(client: AsyncClient, redis: FakeRedis, graph_tag):
+    """测试缓存缺失时从数据库读取，只回填序列化结果而不修改当前标识"""
+    response = await client.get("/graph")
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'"{graph_tag}"'
+    assert response.json()["result"]["nodes"]
+    assert redis.data[GRAPH_PAYLOAD_KEY.format(tag=graph_tag)] == response.content
+    assert GRAPH_TAG_KEY not in redis.data
+    assert redis.jobs == ["cache_graph"]
+
+    # 缓存任务尚未执行时，再次缓存缺失不会重复提交
+    response = await client.get("/graph")
+    assert response.status_code == 200
+    assert redis.jobs == ["cache_graph"]
+
+
+async def test_get_graph_etag(client: AsyncClient, redis: FakeRedis, graph_tag):
+    """测试缓存命中时返回预先序列化的响应体，并支持 ETag 条件请求"""
+    payload = b'{"code": 0}'
+    await redis.set(GRAPH_TAG_KEY, graph_tag)
+    await redis.set(GRAPH_PAYLOAD_KEY.format(tag=graph_tag), payload)
+
+    response = await client.get("/graph")
+    assert response.status_code == 200
+    assert response.content == payload
+    etag = response.headers["etag"]
+
+    response = await client.get("/graph", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert not redis.jobs
@@ -97,7 +97,8 @@ def pdf_files():
 async def uploaded_file_name(pdf_file: UploadFile) -> str:
     from app.dependencies.document import _save_uploaded_file
 
-    return await _save_uploaded_file(file=pdf_file)
+    saved_file = await _save_uploaded_file(file=pdf_file)
+    return saved_file.file_name
 
 
 @pytest_asyncio.fixture
@@ -0,0 +1,48 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.principal_cache import principal_cache
+from app.core.rate_limit import RateLimiter
+from app.schemas.user import LoginParams, RegisterParams
+from app.services.auth import AuthService
+
+
+@pytest.fixture
+def auth_svc(db: AsyncSession):
+    principal_cache.clear()
+    return AuthService(db)
+
+
+@pytest.mark.asyncio
+async def test_current_user_cache(auth_svc: AuthService):
+    """测试缓存当前用户并在吊销令牌后失效"""
+    await auth_svc.register(
+        RegisterParams(username="tester", password="password", real_name="测试")
+    )
+    result = await auth_svc.login(LoginParams(username="tester", password="password"))
+    assert result is not None
+
+    principal = await auth_svc.get_current_user(result.token)
+    assert principal.username == "tester"
+    assert principal.perm_codes == auth_svc.get_perm_codes("test")
+    # 再次请求直接命中缓存
+    assert await auth_svc.get_current_user(result.token) is principal
+
+    await auth_svc.revoke_tokens("tester")
+    with pytest.raises(HTTPException):
+        await auth_svc.get_current_user(result.token)
+
+    result = await auth_svc.login(LoginParams(username="tester", password="password"))
+    assert result is not None
+    assert (await auth_svc.get_current_user(result.token)).token_version == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter():
+    """测试超出次数后返回等待时间"""
+    limiter = RateLimiter("test", limit=2, window=60)
+    assert await limiter.hit("client") is None
+    assert await limiter.hit("client") is None
+    assert 0 < await limiter.hit("client") <= 60
+    assert await limiter.hit("other") is None
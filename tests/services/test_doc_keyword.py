@@ -1,6 +1,9 @@
 import pytest
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.jobs import GRAPH_QUEUE
+from app.schemas.keyword import KeywordCreate
+from app.schemas.subject import Subject
 from app.services import DocKeywordService
 
 
@@ -27,3 +30,86 @@ async def test_create_keywords_for_nonexistent_doc(doc_kw_svc: DocKeywordService
     """测试为不存在的文档创建关键词"""
     doc = await doc_kw_svc.create_keywards_for_doc(999, ["测试"])
     assert doc is None
+
+
+async def test_index_keywords(doc_kw_svc: DocKeywordService, sample_doc: int):
+    """测试统计新增关键词在文档中的出现次数"""
+    await doc_kw_svc.kw_svc.create_keyword(
+        KeywordCreate(name="计数测试", subject=Subject.FINANCE)
+    )
+    keywords = await doc_kw_svc.kw_svc.get_unindexed_keywords()
+    keyword_id = next(k for k, name in keywords.items() if name == "计数测试")
+
+    async def docs():
+        yield sample_doc, "计数测试，再次计数测试"
+
+    count = await doc_kw_svc.index_keywords({keyword_id: "计数测试"}, docs())
+    assert count == 1
+
+    counts = await doc_kw_svc.get_keyword_counts(sample_doc)
+    assert counts[keyword_id] == 2
+    assert keyword_id not in await doc_kw_svc.kw_svc.get_unindexed_keywords()
+
+    await doc_kw_svc.kw_svc.delete_keyword(keyword_id)
+    assert keyword_id not in await doc_kw_svc.get_keyword_counts(sample_doc)
+
+
+async def test_create_keywords_for_docs(doc_kw_svc: DocKeywordService, sample_doc: int):
+    """测试批量为文档关联关键词"""
+    existing_id = await doc_kw_svc.kw_svc.create_keyword(
+        KeywordCreate(name="已有关键词", subject=Subject.FINANCE)
+    )
+    names = ["已有关键词", "新关键词", "新关键词"]
+
+    count = await doc_kw_svc.create_keywords_for_docs(
+        {sample_doc: names, 999: ["不存在的文档"]}, Subject.ECONOMICS
+    )
+    assert count == 2
+    # 已有的关联被跳过
+    count = await doc_kw_svc.create_keywords_for_docs(
+        {sample_doc: names}, Subject.ECONOMICS
+    )
+    assert count == 0
+
+    doc = await doc_kw_svc.create_keywards_for_doc(
+        sample_doc, ["新关键词"], Subject.ECONOMICS
+    )
+    assert doc is not None
+    assert {kw.name for kw in doc.keywords} == {"已有关键词", "新关键词"}
+    assert await doc_kw_svc.kw_svc.get_keyword_by_name("不存在的文档") is None
+
+    keyword_ids = [kw.id for kw in doc.keywords]
+    for keyword_id in keyword_ids:
+        await doc_kw_svc.kw_svc.delete_keyword(keyword_id)
+    assert existing_id in keyword_ids
+
+
+class FakeRedis:
+    """记录提交的任务"""
+
+    def __init__(self):
+        self.jobs: list[tuple[str, str | None]] = []
+
+    async def enqueue_job(self, function: str, *args, _queue_name=None, **kwargs):
+        self.jobs.append((function, _queue_name))
+
+
+async def test_create_keywords_enqueue_index(db: AsyncSession, sample_doc: int):
+    """测试只在新建关键词时提交 index_keywords"""
+    redis = FakeRedis()
+    doc_kw_svc = DocKeywordService(db, redis)  # type: ignore[arg-type]
+
+    await doc_kw_svc.create_keywords_for_docs(
+        {sample_doc: ["索引关键词"]}, Subject.FINANCE
+    )
+    assert redis.jobs == [("index_keywords", GRAPH_QUEUE)]
+
+    # 关键词已存在时不再提交
+    await doc_kw_svc.create_keywords_for_docs(
+        {sample_doc: ["索引关键词"]}, Subject.FINANCE
+    )
+    assert len(redis.jobs) == 1
+
+    keyword = await doc_kw_svc.kw_svc.get_keyword_by_name("索引关键词")
+    assert keyword is not None
+    await doc_kw_svc.kw_svc.delete_keyword(keyword.id)
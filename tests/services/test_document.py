@@ -1,8 +1,23 @@
+import hashlib
+import shutil
+
 import pytest
+from fastapi import UploadFile
 from kgtools.schemas.preprocessing import ExtractConfig, NormalizeConfig, OCREngine
 
-from app.schemas.document import DocCreate, DocState, DocUpdate
+from app.core import compression
+from app.database import transaction
+from app.dependencies.document import _save_uploaded_file
+from app.models import Keyword, document_keyword_counts
+from app.schemas.document import DocCreate, DocFilter, DocState
+from app.schemas.subject import Subject
 from app.services import DocService
+from app.settings import settings
+
+# PDF 提取依赖 poppler 的命令行工具
+requires_poppler = pytest.mark.skipif(
+    shutil.which("pdfinfo") is None, reason="poppler is not installed"
+)
 
 
 @pytest.mark.asyncio
@@ -27,30 +42,164 @@ async def test_create_doc(
 
 
 @pytest.mark.asyncio
-async def test_read_doc(sample_doc: int, doc_svc: DocService):
-    """测试读取单个文档"""
-    doc = await doc_svc.get_doc(doc_id=sample_doc)
+async def test_save_uploaded_file(pdf_file: UploadFile):
+    """测试分块保存上传文件并计算哈希"""
+    content = await pdf_file.read()
+    await pdf_file.seek(0)
+
+    saved_file = await _save_uploaded_file(pdf_file)
+    file_path = settings.UPLOAD_DIR / f"{saved_file.file_name}.pdf"
+
+    assert file_path.read_bytes() == content
+    assert saved_file.sha256 == hashlib.sha256(content).hexdigest()
+    assert saved_file.size == len(content)
+    assert not list(settings.UPLOAD_DIR.glob(".*.part"))
+
+    file_path.unlink()
 
+
+@pytest.mark.asyncio
+async def test_create_docs(uploaded_file_name: str, doc_svc: DocService):
+    """测试批量创建文档"""
+    doc_creates = [
+        DocCreate(
+            title=f"批量文档{i}",
+            local_file_name=uploaded_file_name,
+            file_type="pdf",
+        )
+        for i in range(3)
+    ]
+    rows = await doc_svc.create_docs(doc_creates)
+
+    assert [row.title for row in rows] == [doc.title for doc in doc_creates]
+    assert all(row.state == DocState.UPLOADED for row in rows)
+
+    for row in rows:
+        await doc_svc.delete_doc(row.id)
+
+
+@pytest.mark.asyncio
+async def test_transition_docs(sample_doc: int, doc_svc: DocService):
+    """测试按条件批量切换文档状态"""
+    docs = await doc_svc.transition_docs(
+        DocFilter(ids=[sample_doc]), {DocState.EXTRACTED}, DocState.NORMALIZING
+    )
+    assert docs == []
+
+    docs = await doc_svc.transition_docs(
+        DocFilter(state=DocState.UPLOADED),
+        {DocState.UPLOADED},
+        DocState.EXTRACTING,
+    )
+    assert (sample_doc, DocState.UPLOADED) in docs
+
+    doc = await doc_svc.get_doc(sample_doc)
     assert doc is not None
-    assert doc.id == sample_doc
-    assert doc.title
+    assert doc.state == DocState.EXTRACTING
 
 
 @pytest.mark.asyncio
-async def test_update_doc(
+async def test_create_duplicate_doc(
     sample_doc: int,
+    uploaded_file_name: str,
     doc_svc: DocService,
 ):
-    """测试修改文档"""
-    new_title = "更新后的标题"
+    """测试内容相同的文档共享文件并复用处理结果"""
+    doc = await doc_svc.get_doc(sample_doc)
+    assert doc is not None
+    upload_path = doc.upload_path
+    async with transaction(doc_svc.db):
+        await doc.write_text("提取文本", DocState.EXTRACTED)
 
-    updated = await doc_svc.update_doc(
-        doc_id=sample_doc,
-        doc_update=DocUpdate(title=new_title),
+    duplicate = await doc_svc.create_doc(
+        DocCreate(
+            title="重复文档",
+            local_file_name=uploaded_file_name,
+            file_type="pdf",
+        )
     )
+    assert duplicate.state == DocState.EXTRACTED
+    assert duplicate.upload_path == upload_path
+    assert await duplicate.read_text(DocState.EXTRACTED) == "提取文本"
 
-    assert updated is not None
-    assert updated.title == new_title
+    await doc_svc.delete_doc(duplicate.id)
+    assert upload_path.exists()
+
+
+@pytest.mark.asyncio
+async def test_create_duplicate_docs_copy_counts(
+    sample_doc: int,
+    uploaded_file_name: str,
+    doc_svc: DocService,
+):
+    """测试批量创建时复制内容相同的文档的关键词出现次数"""
+    doc = await doc_svc.get_doc(sample_doc)
+    assert doc is not None
+    keyword = Keyword(name="复制计数", subject=list(Subject)[0])
+    async with transaction(doc_svc.db):
+        await doc.write_text("提取文本", DocState.EXTRACTED)
+        doc_svc.db.add(keyword)
+        await doc_svc.db.flush()
+        keyword_id = keyword.id
+        await doc_svc.db.execute(
+            document_keyword_counts.insert().values(
+                document_id=sample_doc, keyword_id=keyword_id, count=3
+            )
+        )
+
+    rows = await doc_svc.create_docs(
+        [
+            DocCreate(
+                title=f"重复文档{i}",
+                local_file_name=uploaded_file_name,
+                file_type="pdf",
+            )
+            for i in range(2)
+        ]
+    )
+    result = await doc_svc.db.execute(
+        document_keyword_counts.select().where(
+            document_keyword_counts.c.document_id.in_([row.id for row in rows])
+        )
+    )
+    counts = {(r.document_id, r.keyword_id, r.count) for r in result}
+    assert counts == {(row.id, keyword_id, 3) for row in rows}
+
+    for row in rows:
+        await doc_svc.delete_doc(row.id)
+    async with transaction(doc_svc.db):
+        await doc_svc.db.delete(keyword)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("codec", ["gzip", "none"])
+async def test_compressed_text(
+    sample_doc: int, doc_svc: DocService, monkeypatch, codec: str
+):
+    """测试压缩存储文本的读写"""
+    monkeypatch.setattr(settings, "TEXT_COMPRESSION", codec)
+    text = "机器学习与统计方法。" * 100
+
+    doc = await doc_svc.get_doc(sample_doc)
+    assert doc is not None
+    async with transaction(doc_svc.db):
+        await doc.write_text(text, DocState.EXTRACTED)
+
+    doc = await doc_svc.get_doc(sample_doc)
+    assert doc is not None
+    path = doc.find_path(DocState.EXTRACTED)
+    assert compression.get_path_codec(path) == codec
+    assert await doc.read_text(DocState.EXTRACTED) == text
+
+
+@pytest.mark.asyncio
+async def test_read_doc(sample_doc: int, doc_svc: DocService):
+    """测试读取单个文档"""
+    doc = await doc_svc.get_doc(doc_id=sample_doc)
+
+    assert doc is not None
+    assert doc.id == sample_doc
+    assert doc.title
 
 
 @pytest.mark.asyncio
@@ -64,31 +213,46 @@ async def test_delete_doc(sample_doc: int, doc_svc: DocService):
 
 
 @pytest.mark.asyncio
+@requires_poppler
 @pytest.mark.parametrize("ocr_engine", list(OCREngine))
 async def test_extract_doc_text(
     sample_doc: int, ocr_engine: OCREngine, doc_svc: DocService
 ):
     """测试提取文档文本"""
     config = ExtractConfig(ocr_engine=ocr_engine, force_ocr=True, last_page=1)
-    doc = await doc_svc.extract_doc(
-        doc_id=sample_doc,
-        extract_config=config,
-    )
+    text = await doc_svc.extract_doc(doc_id=sample_doc, config=config)
 
+    assert text is not None
+    doc = await doc_svc.get_doc(sample_doc)
     assert doc is not None
     assert doc.state == DocState.EXTRACTED
 
 
 @pytest.mark.asyncio
+@requires_poppler
 async def test_normalize_doc_text(sample_doc: int, doc_svc: DocService):
     """测试清洗文档文本"""
-    await doc_svc.extract_doc(
-        doc_id=sample_doc, extract_config=ExtractConfig(last_page=1)
-    )
+    await doc_svc.extract_doc(doc_id=sample_doc, config=ExtractConfig(last_page=1))
 
-    doc = await doc_svc.normalize_doc(
-        doc_id=sample_doc, normalize_config=NormalizeConfig()
-    )
+    text = await doc_svc.normalize_doc(doc_id=sample_doc, config=NormalizeConfig())
 
+    assert text is not None
+    doc = await doc_svc.get_doc(sample_doc)
     assert doc is not None
     assert doc.state == DocState.NORMALIZED
+
+
+@pytest.mark.asyncio
+@requires_poppler
+async def test_skip_unchanged_stages(sample_doc: int, doc_svc: DocService):
+    """测试输入未变化时跳过提取和标准化"""
+    config = ExtractConfig(last_page=1)
+    assert await doc_svc.extract_doc(sample_doc, config) is not None
+    assert await doc_svc.extract_doc(sample_doc, config) is None
+
+    assert await doc_svc.normalize_doc(sample_doc, NormalizeConfig()) is not None
+    assert await doc_svc.normalize_doc(sample_doc, NormalizeConfig()) is None
+
+    # 重新提取后标准化的输入随之变化
+    assert await doc_svc.extract_doc(sample_doc, ExtractConfig(last_page=2))
+    assert await doc_svc.normalize_doc(sample_doc, NormalizeConfig()) is not None
@@ -0,0 +1,117 @@
+import pytest
+from kgtools.schemas.graph import GraphConfig
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.matcher import KeywordMatcher
+from app.models import DocRelation, Edge, GraphVersion, Keyword
+from app.schemas.subject import Subject
+from app.services import GraphService
+
+MATCHER = KeywordMatcher({1: "机器学习", 2: "统计", 3: "金融"})
+DOCS = {
+    1: "机器学习依赖统计方法。",
+    2: "统计在金融中的应用。",
+    3: "机器学习、统计与金融。",
+}
+
+
+async def _iter_docs(docs: dict[int, str]):
+    for doc_id, text in docs.items():
+        yield doc_id, text
+
+
+@pytest.fixture
+def graph_svc(db: AsyncSession):
+    return GraphService(db)
+
+
+async def _get_edges(db: AsyncSession):
+    result = await db.execute(select(Edge.source, Edge.target, Edge.weight))
+    return sorted(result.all())
+
+
+async def _clear_graph(db: AsyncSession):
+    await db.execute(delete(Edge))
+    await db.execute(delete(DocRelation))
+    await db.execute(delete(GraphVersion))
+    await db.commit()
+
+
+async def test_incremental_matches_full_build(graph_svc: GraphService, db):
+    """测试增量更新与全量构建结果一致"""
+    await graph_svc.build_graph(_iter_docs(DOCS), MATCHER, GraphConfig())
+    full_edges = await _get_edges(db)
+    await _clear_graph(db)
+
+    for doc_id, text in DOCS.items():
+        await graph_svc.update_doc_graph(doc_id, text, MATCHER, GraphConfig())
+    assert await _get_edges(db) == full_edges
+
+    await _clear_graph(db)
+
+
+async def test_remove_doc_from_graph(graph_svc: GraphService, db):
+    """测试移除文档后只扣除该文档的贡献"""
+    await graph_svc.build_graph(_iter_docs({1: DOCS[1]}), MATCHER, GraphConfig())
+    expected = await _get_edges(db)
+
+    await graph_svc.update_doc_graph(2, DOCS[2], MATCHER, GraphConfig())
+    await graph_svc.update_doc_graph(2, None, MATCHER, GraphConfig())
+
+    assert await _get_edges(db) == expected
+    assert await graph_svc.get_graph_doc_ids() <= {1}
+
+    await _clear_graph(db)
+
+
+async def test_apply_overlapping_deltas(graph_svc: GraphService, db):
+    """测试重叠的权重增量合并到同一条边上，归零的边被删除"""
+    version_id = await graph_svc._get_or_create_active_version_id()
+    await graph_svc._apply_edge_deltas(version_id, {(1, 2): 1.0, (2, 3): 0.5})
+    await graph_svc._apply_edge_deltas(version_id, {(1, 2): 2.0, (2, 3): -0.5})
+    await db.commit()
+
+    assert await _get_edges(db) == [(1, 2, 3.0)]
+
+    await _clear_graph(db)
+
+
+async def test_rebuild_switches_version(graph_svc: GraphService, db):
+    """测试全量重建切换激活版本并回收旧版本"""
+    old_version = await graph_svc.build_graph(_iter_docs(DOCS), MATCHER, GraphConfig())
+    new_version = await graph_svc.build_graph(_iter_docs(DOCS), MATCHER, GraphConfig())
+
+    active_version = await graph_svc.get_active_version()
+    assert active_version is not None
+    assert active_version.id == new_version != old_version
+
+    assert await graph_svc.gc_versions() == 1
+    result = await db.execute(select(Edge.version).distinct())
+    assert result.scalars().all() == [new_version]
+
+    await _clear_graph(db)
+
+
+async def test_get_subgraph(graph_svc: GraphService, db):
+    """测试按关键词邻域和权重提取子图"""
+    db.add_all(
+        Keyword(id=keyword_id, name=name, subject=Subject.DATA_SCIENCE)
+        for keyword_id, name in zip(MATCHER.ids, MATCHER.names)
+    )
+    await db.commit()
+
+    await graph_svc.build_graph(_iter_docs(DOCS), MATCHER, GraphConfig())
+    graph = await graph_svc.get_graph()
+    assert graph is not None
+
+    subgraph = await graph_svc.get_subgraph(keyword_id=1, hops=1)
+    assert subgraph is not None
+    assert {node.id for node in subgraph.nodes} <= {node.id for node in graph.nodes}
+
+    subgraph = await graph_svc.get_subgraph(top=1)
+    assert subgraph is not None
+    assert len(subgraph.edges) == 1
+
+    await db.execute(delete(Keyword).where(Keyword.id.in_(MATCHER.ids)))
+    await _clear_graph(db)
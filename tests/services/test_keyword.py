@@ -1,8 +1,7 @@
 import pytest
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.exceptions.keyword import KeywordAlreadyExistsError
-from app.schemas.keyword import KeywordCreate
+from app.schemas.keyword import KeywordCreate, KeywordImportResult
 from app.schemas.subject import Subject
 from app.services import KeywordService
 
@@ -14,56 +13,108 @@ def kw_svc(db: AsyncSession):
 
 async def test_create_keyword(kw_svc: KeywordService):
     """测试创建关键词"""
-    keyword = await kw_svc.create_keyword(
+    keyword_id = await kw_svc.create_keyword(
         KeywordCreate(name="测试关键词", subject=Subject.ECONOMICS)
     )
+    keyword = await kw_svc.get_keyword(keyword_id)
 
+    assert keyword is not None
     assert keyword.name == "测试关键词"
     assert keyword.subject == Subject.ECONOMICS
-    await kw_svc.delete_keyword(keyword.id)
+    await kw_svc.delete_keyword(keyword_id)
 
 
 async def test_create_duplicate_keyword(kw_svc: KeywordService):
     """测试创建重复关键词"""
-    keyword = await kw_svc.create_keyword(
+    keyword_id = await kw_svc.create_keyword(
         KeywordCreate(name="重复关键词", subject=Subject.ECONOMICS)
     )
 
-    with pytest.raises(KeywordAlreadyExistsError):
+    with pytest.raises(ValueError):
         await kw_svc.create_keyword(
             KeywordCreate(name="重复关键词", subject=Subject.ECONOMICS)
         )
 
-    await kw_svc.delete_keyword(keyword.id)
+    await kw_svc.delete_keyword(keyword_id)
 
 
 async def test_read_keyword(kw_svc: KeywordService):
     """测试读取关键词"""
-    created = await kw_svc.create_keyword(
+    keyword_id = await kw_svc.create_keyword(
         KeywordCreate(name="测试关键词", subject=Subject.ECONOMICS)
     )
-    keyword = await kw_svc.get_keyword(created.id)
+    keyword = await kw_svc.get_keyword_by_name("测试关键词")
 
     assert keyword is not None
-    assert keyword.name == "测试关键词"
+    assert keyword.id == keyword_id
 
-    await kw_svc.delete_keyword(keyword.id)
+    await kw_svc.delete_keyword(keyword_id)
 
 
 async def test_read_keywords(kw_svc: KeywordService):
     """测试读取关键词列表"""
     # 创建测试数据
     names = ["关键词1", "关键词2", "测试3"]
-    for name in names:
+    keyword_ids = [
         await kw_svc.create_keyword(KeywordCreate(name=name, subject=Subject.ECONOMICS))
+        for name in names
+    ]
 
-    # 测试基本查询
-    keywords = await kw_svc.read_keywords(skip=0, limit=10)
-    assert len(keywords) == 3
-
-    # 测试搜索
-    keywords = await kw_svc.read_keywords(skip=0, limit=10, search="关键词")
+    # 测试分页查询
+    keywords, total = await kw_svc.get_keyword_list(skip=0, limit=2)
+    assert total == 3
     assert len(keywords) == 2
 
-    for name in names:
-        await kw_svc.delete_keyword_by_name(name)
+    # 测试按学科筛选
+    keywords, total = await kw_svc.get_keyword_list(subject=[Subject.FINANCE])
+    assert total == 0
+
+    for keyword_id in keyword_ids:
+        await kw_svc.delete_keyword(keyword_id)
+
+
+async def test_import_keywords(kw_svc: KeywordService):
+    """测试分块导入关键词，已存在的关键词计为跳过"""
+
+    async def chunks():
+        yield [
+            {"name": "导入1", "subject": Subject.FINANCE},
+            {"name": "导入2", "subject": Subject.ECONOMICS},
+        ], 1, 1
+        yield [{"name": "导入2", "subject": Subject.FINANCE}], 0, 0
+
+    result = await kw_svc.import_keywords(chunks())
+    assert result == KeywordImportResult(inserted=2, skipped=2, invalid=1)
+
+    keywords = await kw_svc.get_keywords()
+    for keyword_id in [kw.id for kw in keywords if kw.name.startswith("导入")]:
+        await kw_svc.delete_keyword(keyword_id)
+
+
+async def test_create_keywords_skip_existing(kw_svc: KeywordService):
+    """测试批量创建时跳过已存在的关键词"""
+    keyword_id = await kw_svc.create_keyword(
+        KeywordCreate(name="已存在", subject=Subject.FINANCE)
+    )
+    with pytest.raises(ValueError):
+        await kw_svc.create_keyword(
+            KeywordCreate(name="已存在", subject=Subject.FINANCE)
+        )
+
+    inserted = await kw_svc.create_keywords(
+        [
+            KeywordCreate(name="已存在", subject=Subject.ECONOMICS),
+            KeywordCreate(name="新增", subject=Subject.ECONOMICS),
+            KeywordCreate(name="新增", subject=Subject.ECONOMICS),
+        ]
+    )
+    assert inserted == 1
+    keyword = await kw_svc.get_keyword_by_name("已存在")
+    assert keyword is not None
+    assert keyword.subject == Subject.FINANCE
+
+    new_keyword = await kw_svc.get_keyword_by_name("新增")
+    assert new_keyword is not None
+    new_keyword_id = new_keyword.id
+    await kw_svc.delete_keyword(keyword_id)
+    await kw_svc.delete_keyword(new_keyword_id)